@@ -0,0 +1,186 @@
+"""
+Semantic answer cache
+---------------------
+Answers to repeated agent questions are served locally instead of going through
+a full assistant run. Entries are scoped by a context key (document set,
+assistant instructions and, after the first turn, the preceding exchange) and
+matched on normalized question text, first exactly and then by cosine
+similarity of hashed n-gram signatures of their content words, computed with
+NumPy, so filler ("por favor", "é que", articles) does not matter. A
+near-duplicate must also have the same content words: questions that differ in
+one product, channel or negation ("Base" vs "Premium", "email" vs "telefone",
+"não") are different questions however similar the rest of the wording is.
+"""
+
+import re
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+
+ANSWER_CACHE_SIZE = 512
+ANSWER_CACHE_TTL = 6 * 3600  # seconds
+ANSWER_CACHE_THRESHOLD = 0.8  # minimum cosine similarity (of content words) for a near-duplicate hit
+ANSWER_CACHE_MIN_WORDS = 3  # content words; shorter questions usually depend on the conversation
+SIGNATURE_DIMS = 2048
+CONTENT_STEM_CHARS = 6  # crude stemming: "cobertura"/"coberturas", "explico"/"explicar"
+# Function words (accents already stripped) ignored when comparing content words.
+# Negations ("nao", "sem", "not", "without") are deliberately not in this list.
+STOPWORDS = frozenset("""
+a o as os um uma uns umas de do da dos das em no na nos nas por pelo pela pelos pelas para pra
+com ao aos e ou que qual quais quanto quanta quantos quantas como quando onde quem se
+isto isso este esta estes estas esse essa esses essas aquilo aquele aquela lhe lhes me te
+eu tu ele ela eles elas voce voces meu minha meus minhas seu sua seus suas
+sao ser estao tem ter ha pode posso podem devo deve favor
+the an of to in on at for with by from and or what which how when where who whom whose
+is are was be been do does did can could should would will i you he she it we they me my your
+its our their this that these those there if please
+""".split())
+
+
+def normalize_question(text):
+    """
+    Lowercase, strip accents and punctuation, and collapse whitespace.
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def content_terms(normalized):
+    """
+    Stemmed content words of a normalized question, in order, ignoring function words.
+    """
+    return [word[:CONTENT_STEM_CHARS] for word in normalized.split() if word not in STOPWORDS]
+
+
+def content_words(normalized):
+    return frozenset(content_terms(normalized))
+
+
+def context_hash(context):
+    """
+    64-bit id of a context key, stored per slot instead of an ever-growing id map.
+    """
+    return int.from_bytes(hashlib.blake2b(str(context).encode(), digest_size=8).digest(), "little", signed=True)
+
+
+def context_key(*parts):
+    """
+    Hash the pieces of state an answer depends on (instructions, model, documents,
+    and the preceding exchange for questions asked after the first turn).
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (list, tuple, set)):
+            part = "\n".join(sorted(part))
+        digest.update(str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def signature(normalized, dims=SIGNATURE_DIMS):
+    """
+    L2-normalized hashed bag of content-word unigrams and bigrams.
+    """
+    words = content_terms(normalized)
+    grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    vector = np.zeros(dims, dtype=np.float32)
+    for gram in grams:
+        h = int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=8).digest(), "little")
+        vector[h % dims] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class AnswerCache:
+    """
+    Size- and TTL-bounded cache of (reply, sources) per question.
+    Signatures live in one preallocated matrix, so a near-duplicate lookup is a
+    single matrix-vector product over all slots.
+    """
+    def __init__(self, maxsize=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL,
+                 threshold=ANSWER_CACHE_THRESHOLD, min_words=ANSWER_CACHE_MIN_WORDS,
+                 dims=SIGNATURE_DIMS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.min_words = min_words
+        self.dims = dims
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((maxsize, dims), dtype=np.float32)
+        self._slot_context = np.zeros(maxsize, dtype=np.int64)  # context_hash of each slot
+        self._slot_stored_at = np.zeros(maxsize, dtype=np.float64)
+        self._slot_words = [None] * maxsize
+        self._entries = OrderedDict()  # (context, normalized) -> (slot, reply, sources)
+        self._free_slots = list(range(maxsize - 1, -1, -1))
+        self._slot_keys = [None] * maxsize
+
+    def cacheable(self, question):
+        """
+        Whether the question has enough content words to stand on its own;
+        filler ("como é que eu faço isso?") does not count towards `min_words`.
+        """
+        return len(content_words(normalize_question(question))) >= self.min_words
+
+    def get(self, context, question):
+        """
+        Return (reply, sources) for the question or a near-duplicate of it, or None.
+        """
+        normalized = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get((context, normalized))
+            if entry is None:
+                entry = self._nearest(context, normalized, now)
+            if entry is None:
+                return None
+            slot, reply, sources = entry
+            if now - self._slot_stored_at[slot] > self.ttl:
+                self._evict(self._slot_keys[slot])
+                return None
+            self._entries.move_to_end(self._slot_keys[slot])
+            return reply, list(sources)
+
+    def put(self, context, question, reply, sources):
+        normalized = normalize_question(question)
+        key = (context, normalized)
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            if not self._free_slots:
+                self._evict(next(iter(self._entries)))
+            slot = self._free_slots.pop()
+            self._vectors[slot] = signature(normalized, self.dims)
+            self._slot_words[slot] = content_words(normalized)
+            self._slot_context[slot] = context_hash(context)
+            self._slot_stored_at[slot] = time.time()
+            self._slot_keys[slot] = key
+            self._entries[key] = (slot, reply, list(sources))
+
+    def _nearest(self, context, normalized, now):
+        scores = self._vectors @ signature(normalized, self.dims)
+        live = (self._slot_context == context_hash(context)) & (now - self._slot_stored_at <= self.ttl)
+        scores[~live] = -1.0
+        words = content_words(normalized)
+        candidates = np.flatnonzero(scores >= self.threshold)
+        for slot in candidates[np.argsort(-scores[candidates])]:
+            # Similar wording is not enough; a changed content word changes the question
+            if self._slot_words[slot] == words and self._slot_keys[slot][0] == context:
+                return self._entries[self._slot_keys[slot]]
+        return None
+
+    def _evict(self, key):
+        slot, _reply, _sources = self._entries.pop(key)
+        self._vectors[slot] = 0.0
+        self._slot_context[slot] = 0
+        self._slot_keys[slot] = None
+        self._slot_words[slot] = None
+        self._free_slots.append(slot)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
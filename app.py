@@ -8,47 +8,47 @@ Authors: Bábara Capitão (20211532),Carolina Silvestre(20211512),Ilona Nacu(202
 """
 
 import os
-import time
 import base64
-import re
-import tempfile
-import numpy as np
+import secrets
+import functools
+from types import SimpleNamespace
 import streamlit as st
-from openai import AzureOpenAI
-import requests
-import soundfile as sf
-from streamlit_webrtc import webrtc_streamer, WebRtcMode, AudioProcessorBase
-import av
-import io
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.utils import simpleSplit, ImageReader
+from rerun_profile import RerunProfiler, RerunStats
+from answer_cache import context_key
+from context_window import ContextWindow
+from pdf_export import ChatPDFExporter
+from chat_messages import ChatMessage, history_window
+from session_store import SessionStore
+import metrics
+from assistant_core import (
+    MODEL_DEPLOYMENT, RUN_ERRORS, load_instructions, load_or_create_assistant, create_thread,
+    send_and_get_response, run_scheduled, get_answer_cache, get_background_pool, get_run_scheduler,
+    record_cached_turn, lookup_faq, compact_thread, get_vector_store_manager, upload_files_to_assistant,
+    vector_store_for, transcribe_pcm, SPECULATIVE_PREFETCH, get_followup_prefetcher,
+    METRICS_PORT, METRICS_JSONL_PATH, METRICS_FLUSH_INTERVAL,
+)
+# reportlab (PDF export, in pdf_export) and streamlit_webrtc/av (audio input) are imported
+# lazily, only on the reruns that actually use them
+
+profiler = RerunProfiler()
 
 # === INITIAL CONFIGURATION ===
-# Load keys and API endpoints from Streamlit secrets for security
-AZURE_API_KEY = st.secrets["azure"]["api_key"]
-AZURE_ENDPOINT = st.secrets["azure"]["endpoint"]
-AZURE_API_VERSION = "2024-05-01-preview"
-MODEL_DEPLOYMENT = "gpt-4o-mini"
-OPENAI_KEY = st.secrets["openai"]["api_key"]
-
-def load_instructions(file_path="assistant_role.txt"):
+# Keys, endpoints and the API client live in assistant_core
+MAX_RECORDING_SECONDS = 300  # older audio is dropped beyond this
+HISTORY_PAGE_MESSAGES = 40  # messages rendered per history page (20 turns)
+
+@st.cache_resource
+def start_metrics_exporters():
     """
-    Loads assistant instructions from a text file.
+    Start the configured metrics exporters once per process.
     """
-    with open(file_path, "r") as f:
-        return f.read().strip()
-
-ASSISTANT_FILE = "AssistantID.TXT"
-ASSISTANT_NAME = "GroupF_Assistant"
-ASSISTANT_ROLE = load_instructions()
-
-# Initialize Azure OpenAI client
-client = AzureOpenAI(
-    api_key=AZURE_API_KEY,
-    azure_endpoint=AZURE_ENDPOINT,
-    api_version=AZURE_API_VERSION,
-)
+    if METRICS_PORT:
+        metrics.start_http_server(int(METRICS_PORT))
+    if METRICS_JSONL_PATH:
+        metrics.start_jsonl_flusher(METRICS_JSONL_PATH, METRICS_FLUSH_INTERVAL)
+    return True
+
+start_metrics_exporters()
 
 # === SESSION STATE DEFAULTS ===
 # Initialize or reset session state variables for the app
@@ -59,7 +59,16 @@ default_session_keys = {
     "audio_recording": False,
     "webrtc_ctx": None,
     "uploaded_file_ids": [],
+    "uploaded_files_key": None,  # uploader selection the file ids were computed for
+    "upload_saved_bytes": 0,
+    "vector_store_binding": None,
+    "pending_thread_sync": None,
+    "context_window": ContextWindow(),
+    "pending_compaction": None,
     "last_sources": [],
+    "pdf_exporter": None,
+    "history_pages": 1,
+    "history_offset": 0,  # older messages still only in the session store
 }
 for k, v in default_session_keys.items():
     if k not in st.session_state:
@@ -71,13 +80,19 @@ LOGO_PATH = os.path.join(os.path.dirname(__file__), "fidelidade_logo.png")
 ICON_PATH = os.path.join(os.path.dirname(__file__), "fidelidade_icon.png")
 ICON_TAB_PATH = os.path.join(os.path.dirname(__file__), "fidelidade_icon_tab.png")
 
+@st.cache_data
+def load_asset_base64(path):
+    """
+    Read and base64-encode a static asset once per process.
+    """
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode()
+
 # Encode images as base64 for embedding in HTML/CSS
-with open(LOGO_PATH, "rb") as f:
-    logo_base64 = base64.b64encode(f.read()).decode()
-with open(ICON_PATH, "rb") as f:
-    icon_base64 = base64.b64encode(f.read()).decode()
-with open(ICON_TAB_PATH, "rb") as f:
-    icon_tab_base64 = base64.b64encode(f.read()).decode()
+logo_base64 = load_asset_base64(LOGO_PATH)
+icon_tab_base64 = load_asset_base64(ICON_TAB_PATH)
+# Passed by path, the icon is served once as a media file instead of inlined in every message
+ASSISTANT_AVATAR = ICON_PATH
 
 # Language dictionary for UI translations
 # --- TRANSLATIONS ---
@@ -101,6 +116,8 @@ LANG_STRINGS = {
         "upload_label": "Carregar ficheiros para consulta",
         "export_pdf": "Exportar como PDF",
         "download_pdf": "Baixar PDF",
+        "upload_saved": "Documentos otimizados: menos {kb} KB a enviar",
+        "earlier_messages": "Mostrar mensagens anteriores",
     },
     "English": {
         "new_chat": "New Chat",
@@ -121,211 +138,205 @@ LANG_STRINGS = {
         "upload_label": "Upload files for assistant context",
         "export_pdf": "Export as PDF",
         "download_pdf": "Download PDF",
+        "upload_saved": "Documents optimised: {kb} KB less to upload",
+        "earlier_messages": "Show earlier messages",
     },
 }
 
 # === HELPER FUNCTIONS ===
 
-def load_or_create_assistant():
+def answer_question(assistant_id, thread_id, message, document_ids, file_ids=None, on_delta=None,
+                    previous=()):
     """
-    Retrieve the assistant by ID if available, otherwise create a new one.
-    Assistant details are persisted locally for reuse.
+    Answer from the semantic cache when the same (or a near-identical) question was
+    already answered for this document set and instructions, or from the local FAQ
+    index when the knowledge documents answer it verbatim; otherwise run the assistant.
+    A follow-up answered speculatively for this thread is served first.
+    `previous` is the preceding exchange (ChatMessages): a question after the first
+    turn may lean on it ("e para o Premium?"), so it is part of the cache scope.
     """
-    if os.path.exists(ASSISTANT_FILE):
-        with open(ASSISTANT_FILE, "r") as f:
-            assistant_id = f.read().strip()
-        assistant = client.beta.assistants.retrieve(assistant_id)
-    else:
-        assistant = client.beta.assistants.create(
-            name=ASSISTANT_NAME,
-            instructions=ASSISTANT_ROLE,
-            model=MODEL_DEPLOYMENT,
-            tools=[{"type": "file_search"}],
+    cache = get_answer_cache()
+    context = context_key(
+        load_instructions(), MODEL_DEPLOYMENT, document_ids or [],
+        "\n\n".join(f"{m.role}: {m.text}" for m in previous),
+    )
+    cacheable = cache.cacheable(message)
+    hit = get_followup_prefetcher().get(thread_id, message) if SPECULATIVE_PREFETCH else None
+    if hit is None and cacheable:
+        hit = cache.get(context, message)
+        metrics.cache_result("answer", hit is not None)
+    if hit is None and not document_ids:
+        # With uploaded documents the question is most likely about those
+        hit = lookup_faq(message)
+    if hit:
+        reply, sources = hit
+        st.session_state.pending_thread_sync = get_background_pool().submit(
+            record_cached_turn, thread_id, message, reply
         )
-        with open(ASSISTANT_FILE, "w") as f:
-            f.write(assistant.id)
-    return assistant
+        return reply, sources
+    # A cached turn must reach the thread before the next run reads it
+    if st.session_state.pending_thread_sync is not None:
+        st.session_state.pending_thread_sync.result()
+        st.session_state.pending_thread_sync = None
+    reply, sources = run_scheduled(
+        thread_id,
+        lambda handle, on_partial: send_and_get_response(
+            assistant_id, thread_id, message, file_ids=file_ids, on_delta=on_partial, handle=handle
+        ),
+        on_delta=on_delta,
+    )
+    if cacheable and reply not in RUN_ERRORS:
+        cache.put(context, message, reply, sources)
+    return reply, sources
 
-def create_thread():
+def track_context(question, reply):
     """
-    Create a new chat thread for conversation context.
+    Count the new turn against the thread's context window and start compacting
+    in the background once the thread grows past the threshold.
     """
-    return client.beta.threads.create()
-
-def get_file_info(file_id):
+    window = st.session_state.context_window
+    window.add_turn(question, reply)
+    if window.needs_compaction() and st.session_state.pending_compaction is None:
+        plan = window.plan_compaction()
+        binding = st.session_state.vector_store_binding
+        store_id = binding[1] if binding else None
+        future = get_background_pool().submit(compact_thread, plan, store_id)
+        st.session_state.pending_compaction = (future, plan, store_id)
+
+def settle_thread():
     """
-    Retrieve file name from file ID (for citation/source display).
+    Switch to the compacted thread, if one was prepared, before the next question runs.
+    On failure the conversation simply continues on the current thread.
+    If documents changed while compacting, the new thread is bound to the current store.
     """
+    pending = st.session_state.pending_compaction
+    if pending is None:
+        return
+    future, plan, store_id = pending
+    st.session_state.pending_compaction = None
     try:
-        file_obj = client.files.retrieve(file_id)
-        file_name = getattr(file_obj, "filename", None) or getattr(file_obj, "name", None) or str(file_obj)
-        return file_name
+        thread, summary = future.result()
     except Exception:
-        return file_id
-
-def send_and_get_response(assistant_id, thread_id, message, file_ids=None):
+        return
+    st.session_state.thread = thread
+    st.session_state.context_window.apply_compaction(plan, summary)
+    binding = st.session_state.vector_store_binding
+    if binding and binding[1] != store_id:
+        # The thread was created with the store of when compaction started
+        get_vector_store_manager().bind_to_thread(thread.id, binding[1])
+    st.session_state.vector_store_binding = (thread.id, binding[1]) if binding else None
+
+@st.cache_resource
+def get_rerun_stats():
     """
-    Send user message (and any file context) to the assistant and wait for the reply.
-    Handles run status and response parsing, including citations/sources.
+    Process-wide aggregate of rerun phase timings.
     """
-    attachments = (
-        [{"file_id": fid, "tools": [{"type": "file_search"}]} for fid in file_ids]
-        if file_ids else None
-    )
-    client.beta.threads.messages.create(
-        thread_id=thread_id,
-        role="user",
-        content=message,
-        attachments=attachments
-    )
-    run = client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id)
-    max_wait = 30  # seconds
-    start_time = time.time()
-    while True:
-        run_status = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
-        if run_status.status == "completed":
-            break
-        elif run_status.status in ["failed", "cancelled", "expired"]:
-            return "Erro: execução falhou.", []
-        if time.time() - start_time > max_wait:
-            return "Erro: tempo limite de execução excedido.", []
-        time.sleep(1)
-    messages = client.beta.threads.messages.list(thread_id=thread_id)
-    last_message_obj = messages.data[0]
-    content_block = last_message_obj.content[0]
-    value = getattr(content_block.text, "value", "")
-    annotations = getattr(content_block.text, "annotations", [])
-    sources = []
-    citation_map = {}
-    citation_counter = 1
-    # Extract sources for citations
-    for annotation in annotations:
-        if getattr(annotation, "type", "") == "file_citation":
-            file_id = getattr(annotation.file_citation, "file_id", None)
-            marker = getattr(annotation, "text", "")
-            if file_id and marker not in citation_map:
-                citation_map[marker] = citation_counter
-                file_name = get_file_info(file_id)
-                sources.append({"n": citation_counter, "file": file_name})
-                citation_counter += 1
-    def replace_marker(match):
-        marker = match.group(0)
-        if marker in citation_map:
-            return f"[{citation_map[marker]}]"
-        return ""
-    clean_message = re.sub(r"【\d+:\d+†source】", replace_marker, value)
-    return clean_message, sources
-
-def whisper_api_transcribe(audio_path, language="pt"):
+    return RerunStats()
+
+def show_rerun_report():
     """
-    Transcribe audio using OpenAI Whisper API.
-    Returns the recognized text.
+    Render the per-phase cost of this rerun and the process averages.
+    Enabled by opening the app with `?profile=1`.
     """
-    with open(audio_path, "rb") as f:
-        response = requests.post(
-            "https://api.openai.com/v1/audio/transcriptions",
-            headers={"Authorization": f"Bearer {OPENAI_KEY}"},
-            files={"file": ("audio.wav", f, "audio/wav")},
-            data={"model": "whisper-1", "language": language},
-        )
-    if response.ok and "text" in response.json():
-        return response.json()["text"]
-    return ""
+    stats = get_rerun_stats()
+    stats.record(profiler)
+    if "profile" in st.query_params:
+        with st.sidebar.expander(f"Rerun cost ({stats.reruns} reruns)"):
+            st.table(stats.report(profiler))
 
-def clean_markdown(text: str) -> str:
+def bind_documents_to_thread(thread_id, files, pairs):
     """
-    Remove or simplify common markdown notations for PDF export.
+    Make the vector store for this document set available to the thread.
+    The thread is only updated when its store changes, not on every rerun.
+    Returns the (digest, file ID) pairs, which change if files had to be uploaded again.
     """
-    text = re.sub(r'\\(.?)\\*', r'\1', text)    # bold
-    text = re.sub(r'(\|_)(.?)\1', r'\2', text)  #italic
-    text = re.sub(r'(.*?)', r'\1', text)        # underline
-    text = re.sub(r'#+\s+', '', text)           # headers
-    text = re.sub(r'(.*?)', r'\1', text)        # code
-    text = re.sub(r'\[\d+\]', '', text)         # [] citations
-    return text.strip()
-
-def export_chat_as_pdf() -> io.BytesIO:
+    store_id, pairs = vector_store_for(files, pairs)
+    if st.session_state.vector_store_binding != (thread_id, store_id):
+        get_vector_store_manager().bind_to_thread(thread_id, store_id)
+        st.session_state.vector_store_binding = (thread_id, store_id)
+    return pairs
+
+@st.cache_resource
+def get_session_store():
     """
-    Export the current chat history as a PDF file.
+    Process-wide SQLite session store; stale sessions are cleaned up once per process.
     """
-    pdf_buffer = io.BytesIO()
-    pdf_canvas = canvas.Canvas(pdf_buffer, pagesize=A4)
-    width, height = A4
-    margin = 50
-    line_height = 18
-    pair_spacing = 8
-    logo_bytes = base64.b64decode(logo_base64)
-    logo_reader = ImageReader(io.BytesIO(logo_bytes))
-    logo_w, logo_h = 250, 28
-    pdf_canvas.drawImage(
-        logo_reader,
-        margin,
-        height - margin - logo_h,
-        width=logo_w,
-        height=logo_h,
-        mask="auto"
-    )
-    y_position = height - margin - logo_h - line_height
-    for role, msg, *_extras in st.session_state.chat_history:
-        text = clean_markdown(msg)
-        font_name = "Helvetica-Bold" if role == "user" else "Helvetica"
-        pdf_canvas.setFont(font_name, 12)
-        wrapped = simpleSplit(text, font_name, 12, width - 2 * margin)
-        for line in wrapped:
-            if y_position < margin + line_height:
-                pdf_canvas.showPage()
-                pdf_canvas.setFont(font_name, 12)
-                pdf_canvas.drawImage(
-                    logo_reader,
-                    margin,
-                    height - margin - logo_h,
-                    width=logo_w,
-                    height=logo_h,
-                    mask="auto"
-                )
-                y_position = height - margin - logo_h - line_height
-            pdf_canvas.drawString(margin, y_position, line)
-            y_position -= line_height
-        if role == "assistant":
-            y_position -= pair_spacing
-    pdf_canvas.save()
-    pdf_buffer.seek(0)
-    return pdf_buffer
-
-def upload_files_to_assistant(files):
+    store = SessionStore()
+    store.cleanup()
+    return store
+
+def get_session_token():
     """
-    Upload files to OpenAI for assistant context and return their IDs.
-    Each file is temporarily saved before upload.
+    Token identifying this chat across browser refreshes, kept in the page URL.
     """
-    file_ids = []
-    for file in files:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file.name) as tmp:
-            tmp.write(file.read())
-            tmp.flush()
-            uploaded_file = client.files.create(
-                file=open(tmp.name, "rb"),
-                purpose="assistants"
-            )
-            file_ids.append(uploaded_file.id)
-    return file_ids
+    token = st.query_params.get("session")
+    if not token:
+        token = secrets.token_urlsafe(16)
+        st.query_params["session"] = token
+    return token
 
-class AudioProcessor(AudioProcessorBase):
+def restore_session():
     """
-    Custom audio processor for WebRTC audio frames.
-    Collects audio frames for later processing/transcription.
+    Restore the chat saved under this page's token, without any API call.
+    Only the latest history page is loaded. Returns False if nothing was saved.
     """
-    def __init__(self):
-        self.frames = []
-    def recv_audio(self, frame: av.AudioFrame) -> av.AudioFrame:
-        data = frame.to_ndarray()
-        self.frames.append(data)
-        return frame
+    stored = get_session_store().load(st.session_state.session_token, HISTORY_PAGE_MESSAGES)
+    if stored is None or not stored.state.get("thread_id"):
+        return False
+    state = stored.state
+    # Only the thread's id is used, so it is not retrieved again. The assistant is
+    # not pinned: it comes from the registry below, so a config change applies here too
+    st.session_state.thread = SimpleNamespace(id=state["thread_id"])
+    st.session_state.chat_history = stored.messages
+    st.session_state.history_offset = stored.offset
+    st.session_state.uploaded_file_ids = state["file_ids"]
+    binding = state["vector_store_binding"]
+    st.session_state.vector_store_binding = tuple(binding) if binding else None
+    st.session_state.last_sources = state["last_sources"]
+    st.session_state.context_window = ContextWindow.from_state(state["context"])
+    return True
+
+def persist_session(new_messages=()):
+    """
+    Queue this session's state, and any messages just added to the history, for saving.
+    """
+    store = get_session_store()
+    token = st.session_state.session_token
+    store.save_state(token, {
+        "thread_id": st.session_state.thread.id,
+        "file_ids": st.session_state.uploaded_file_ids,
+        "vector_store_binding": st.session_state.vector_store_binding,
+        "last_sources": st.session_state.last_sources,
+        "context": st.session_state.context_window.to_state(),
+    })
+    if new_messages:
+        start = st.session_state.history_offset + len(st.session_state.chat_history) - len(new_messages)
+        store.append_messages(token, start, new_messages)
+
+def load_earlier_messages(count):
+    """
+    Prepend up to `count` older messages from the session store to the history.
+    """
+    offset = st.session_state.history_offset
+    if offset <= 0 or count <= 0:
+        return
+    start = max(offset - count, 0)
+    older = get_session_store().load_messages(st.session_state.session_token, start, offset)
+    st.session_state.chat_history[:0] = older
+    st.session_state.history_offset = start
 
 # === INITIALIZE ASSISTANT & THREAD ===
+if "session_token" not in st.session_state:
+    st.session_state.session_token = get_session_token()
+    if restore_session():
+        metrics.inc("sessions_restored_total")
 if "assistant" not in st.session_state:
     st.session_state.assistant = load_or_create_assistant()
 if "thread" not in st.session_state:
     st.session_state.thread = create_thread()
+    persist_session()
+
+profiler.mark("startup")
 
 # === THEME / COLORS ===
 primary_red = "#C80A1E"
@@ -401,6 +412,8 @@ with header_col2:
         if st.button(LANG_STRINGS[st.session_state.language]["login_submit"], key="login_submit"):
             st.success(LANG_STRINGS[st.session_state.language]["login_success"])
 
+profiler.mark("layout")
+
 # === SIDEBAR ===
 
 def show_sources_sidebar():
@@ -415,9 +428,15 @@ def show_sources_sidebar():
 with st.sidebar:
     # Button to reset conversation and state
     if st.button(LANG_STRINGS[st.session_state.language]["new_chat"]):
+        # Stop any run still working on the old thread
+        if "thread" in st.session_state:
+            get_run_scheduler().cancel(st.session_state.thread.id)
         for key in (
             "assistant", "thread", "chat_history", "audio_info", "audio_recording",
-            "webrtc_ctx", "uploaded_file_ids", "last_sources"
+            "webrtc_ctx", "uploaded_file_ids", "uploaded_files_key", "upload_saved_bytes",
+            "vector_store_binding", "pending_thread_sync",
+            "context_window", "pending_compaction", "last_sources", "pdf_exporter",
+            "history_pages", "history_offset"
         ):
             st.session_state.pop(key, None)
         st.session_state.assistant = load_or_create_assistant()
@@ -427,7 +446,18 @@ with st.sidebar:
         st.session_state.audio_recording = False
         st.session_state.webrtc_ctx = None
         st.session_state.uploaded_file_ids = []
+        st.session_state.uploaded_files_key = None
+        st.session_state.upload_saved_bytes = 0
+        st.session_state.vector_store_binding = None
+        st.session_state.pending_thread_sync = None
+        st.session_state.context_window = ContextWindow()
+        st.session_state.pending_compaction = None
         st.session_state.last_sources = []
+        st.session_state.pdf_exporter = None
+        st.session_state.history_pages = 1
+        st.session_state.history_offset = 0
+        get_session_store().reset(st.session_state.session_token)
+        persist_session()
         st.rerun()
     previous_language = st.session_state.language
     selected_language = st.selectbox(
@@ -448,13 +478,31 @@ with st.sidebar:
         key="file_uploader"
     )
     if uploaded_files:
-        with st.spinner("A carregar ficheiros..."):
-            file_ids = upload_files_to_assistant(uploaded_files)
-            st.session_state.uploaded_file_ids = file_ids
+        # The uploader returns the same files on every rerun; only a new selection, or a
+        # thread without them bound (e.g. after "New Chat"), needs hashing and uploading
+        files_key = tuple((file.file_id, file.name, file.size) for file in uploaded_files)
+        binding = st.session_state.vector_store_binding
+        if files_key != st.session_state.uploaded_files_key or not binding or binding[0] != st.session_state.thread.id:
+            with st.spinner("A carregar ficheiros..."):
+                reports = []
+                file_pairs = upload_files_to_assistant(uploaded_files, on_report=reports.append)
+                file_pairs = bind_documents_to_thread(st.session_state.thread.id, uploaded_files, file_pairs)
+                st.session_state.uploaded_file_ids = [file_id for _, file_id in file_pairs]
+                st.session_state.uploaded_files_key = files_key
+                st.session_state.upload_saved_bytes = reports[0].bytes_saved if reports else 0
+                persist_session()
+        if st.session_state.upload_saved_bytes > 0:
+            st.caption(LANG_STRINGS[st.session_state.language]["upload_saved"].format(
+                kb=st.session_state.upload_saved_bytes // 1024
+            ))
 
     # Export chat history as PDF
     if st.button(LANG_STRINGS[st.session_state.language]["export_pdf"]):  
-        chat_pdf = export_chat_as_pdf()  
+        if st.session_state.pdf_exporter is None:
+            st.session_state.pdf_exporter = ChatPDFExporter(LOGO_PATH)
+        with metrics.span("pdf_export", api=False):
+            load_earlier_messages(st.session_state.history_offset)
+            chat_pdf = st.session_state.pdf_exporter.export(st.session_state.chat_history)
         st.download_button(  
             label=LANG_STRINGS[st.session_state.language]["download_pdf"],  
             data=chat_pdf,  
@@ -465,6 +513,8 @@ with st.sidebar:
     # Always show sources right away
     show_sources_sidebar()
 
+profiler.mark("sidebar")
+
 # === CHAT INPUT & AUDIO INPUT ===
 
 user_input = st.chat_input(LANG_STRINGS[st.session_state.language]["chat_input"])
@@ -481,6 +531,8 @@ if audio_toggled:
 
 # If audio recording is enabled, activate WebRTC audio stream
 if st.session_state.audio_recording:
+    from streamlit_webrtc import webrtc_streamer, WebRtcMode
+    from audio_processor import AudioProcessor
     st.info("Clique em Start no widget abaixo para ativar o microfone e em Stop para terminar.")
     st.session_state.webrtc_ctx = webrtc_streamer(
         key="audio",
@@ -489,19 +541,18 @@ if st.session_state.audio_recording:
         media_stream_constraints={"audio": True, "video": False},
         rtc_configuration={"iceServers": [{"urls": ["stun:stun.l.google.com:19302"]}]},
         async_processing=True,
-        audio_processor_factory=AudioProcessor,
+        audio_processor_factory=functools.partial(AudioProcessor, transcribe_pcm, MAX_RECORDING_SECONDS),
     )
 else:
     ctx = st.session_state.webrtc_ctx
     if ctx and hasattr(ctx, "state") and not ctx.state.playing:
         # Process and transcribe the recorded audio
-        if ctx.audio_processor and ctx.audio_processor.frames:
-            audio_data = np.concatenate(ctx.audio_processor.frames, axis=1)
-            temp_audio = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
-            sf.write(temp_audio.name, audio_data.T, 48000, format="WAV")
-            st.audio(temp_audio.name)
+        if ctx.audio_processor and len(ctx.audio_processor.buffer):
+            audio_data = ctx.audio_processor.buffer.to_array()
+            st.audio(audio_data, sample_rate=ctx.audio_processor.buffer.sample_rate)
             st.info("A transcrever áudio via Whisper API...")
-            transcript = whisper_api_transcribe(temp_audio.name, language="pt")
+            # Earlier utterances were transcribed during recording; only the tail is pending
+            transcript = ctx.audio_processor.transcriber.finish()
             if transcript:
                 st.session_state.audio_info = {"transcript": transcript}
                 st.success(f"Pergunta reconhecida: \"{transcript}\"")
@@ -514,30 +565,65 @@ if st.session_state.audio_info.get("transcript"):
     user_input = st.session_state.audio_info["transcript"]
     st.session_state.audio_info = {}
 
+profiler.mark("audio")
+
+# === RENDER CHAT HISTORY ===
+
+# Only the latest page(s) are rendered, so a rerun costs the same however long the chat is
+load_earlier_messages(
+    HISTORY_PAGE_MESSAGES * st.session_state.history_pages - len(st.session_state.chat_history)
+)
+visible_history, hidden_count = history_window(
+    st.session_state.chat_history, HISTORY_PAGE_MESSAGES, st.session_state.history_pages
+)
+hidden_count += st.session_state.history_offset
+if hidden_count:
+    if st.button(f"{LANG_STRINGS[st.session_state.language]['earlier_messages']} ({hidden_count})"):
+        st.session_state.history_pages += 1
+        st.rerun()
+for message in visible_history:
+    with st.chat_message(message.role, avatar=ASSISTANT_AVATAR if message.role == "assistant" else None):
+        st.markdown(message.text)
+
+profiler.mark("history")
+
 # === CHAT ENGINE ===
 
 if user_input:
-    with st.spinner(LANG_STRINGS[st.session_state.language]["processing"]):
-        reply, sources = send_and_get_response(
-            st.session_state.assistant.id,
-            st.session_state.thread.id,
-            user_input,
-            file_ids=st.session_state.uploaded_file_ids
-        )
-    st.session_state.chat_history.append(("user", user_input))
-    st.session_state.chat_history.append(("assistant", reply, sources))
+    settle_thread()
+    with st.chat_message("user"):
+        st.markdown(user_input)
+    question = ChatMessage("user", user_input)
+    with st.chat_message("assistant", avatar=ASSISTANT_AVATAR):
+        reply_placeholder = st.empty()
+        with st.spinner(LANG_STRINGS[st.session_state.language]["processing"]):
+            with metrics.span("answer", api=False):
+                reply, sources = answer_question(
+                    st.session_state.assistant.id,
+                    st.session_state.thread.id,
+                    user_input,
+                    document_ids=st.session_state.uploaded_file_ids,
+                    # Documents reach the run through the thread's vector store, not attachments
+                    file_ids=None if st.session_state.vector_store_binding else st.session_state.uploaded_file_ids,
+                    on_delta=lambda partial: reply_placeholder.markdown(partial + "▌"),
+                    previous=st.session_state.chat_history[-2:],
+                )
+        reply_placeholder.markdown(reply)
+    answer = ChatMessage("assistant", reply, sources, created_at=question.created_at)
+    st.session_state.chat_history += [question, answer]
     st.session_state.last_sources = sources  # for sidebar
+    if reply not in RUN_ERRORS:
+        track_context(user_input, reply)
+        if SPECULATIVE_PREFETCH:
+            binding = st.session_state.vector_store_binding
+            get_followup_prefetcher().schedule(
+                st.session_state.thread.id, user_input, reply,
+                (st.session_state.assistant.id, user_input, reply, binding[1] if binding else None),
+            )
+    persist_session([question, answer])
     # Show sources in sidebar after generating the response
     with st.sidebar:
         show_sources_sidebar()
 
-# === RENDER CHAT HISTORY ===
-
-for role, msg, *sources in st.session_state.chat_history:
-    if role == "user":
-        with st.chat_message("user"):
-            st.markdown(msg)
-    else:
-        avatar = f"data:image/png;base64,{icon_base64}"
-        with st.chat_message("assistant", avatar=avatar):
-            st.markdown(msg)
\ No newline at end of file
+profiler.mark("chat")
+show_rerun_report()
\ No newline at end of file
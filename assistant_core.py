@@ -0,0 +1,575 @@
+"""
+Assistant core
+--------------
+Configuration, API client and the non-UI helpers of the chat assistant:
+assistant/thread setup, sending messages and reading replies, file uploads,
+and Whisper transcription. Kept free of Streamlit widgets and session state so
+app.py, the batch runner and the benchmarks all use the same code paths.
+
+Settings come from Streamlit secrets; the environment variables named below
+take precedence (e.g. to point everything at a local mock backend).
+"""
+
+import os
+import re
+import time
+import queue
+import functools
+from concurrent.futures import ThreadPoolExecutor, CancelledError, TimeoutError as FuturesTimeout
+import streamlit as st
+from openai import AzureOpenAI, APITimeoutError, RateLimitError
+from file_index import FileIndex
+from vector_stores import VectorStoreManager, StaleFilesError
+from file_names import FileNameResolver
+from document_preprocessing import preprocess_documents
+from followup_prefetch import FollowupPrefetcher
+from answer_cache import AnswerCache
+from assistant_registry import AssistantRegistry
+from faq_index import FAQIndex
+from run_scheduler import RunScheduler, RunRateLimited, SchedulerBusy
+import metrics
+
+
+def _setting(section, key, env=None, default=None):
+    """
+    Read a setting from the environment variable `env` or else from Streamlit secrets.
+    """
+    if env and os.environ.get(env):
+        return os.environ[env]
+    try:
+        return st.secrets[section][key]
+    except (KeyError, FileNotFoundError):
+        if default is None:
+            raise
+        return default
+
+# === INITIAL CONFIGURATION ===
+# Load keys and API endpoints from Streamlit secrets for security
+AZURE_API_KEY = _setting("azure", "api_key", "AZURE_OPENAI_API_KEY")
+AZURE_ENDPOINT = _setting("azure", "endpoint", "AZURE_OPENAI_ENDPOINT")
+AZURE_API_VERSION = "2024-05-01-preview"
+MODEL_DEPLOYMENT = "gpt-4o-mini"
+RUN_IDLE_TIMEOUT = 30  # seconds without a run event before giving up
+ERROR_RUN_FAILED = "Erro: execução falhou."
+ERROR_TIMEOUT = "Erro: tempo limite de execução excedido."
+ERROR_BUSY = "Erro: serviço ocupado, tente novamente dentro de momentos."
+RUN_ERRORS = (ERROR_RUN_FAILED, ERROR_TIMEOUT, ERROR_BUSY)
+CONTEXT_SUMMARY_MAX_TOKENS = 400
+CONTEXT_SUMMARY_INSTRUCTIONS = (
+    "Summarise this conversation between an insurance agent and their virtual assistant. "
+    "Keep product names, coverages, figures, the client's situation and any open questions. "
+    "Write in the language of the conversation, in at most 200 words."
+)
+RUN_FAILED_EVENTS = (
+    "thread.run.failed", "thread.run.cancelled", "thread.run.expired", "thread.run.incomplete", "error"
+)
+OPENAI_KEY = _setting("openai", "api_key", "OPENAI_API_KEY")
+WHISPER_BASE_URL = _setting("openai", "base_url", "WHISPER_BASE_URL", "https://api.openai.com/v1")
+WHISPER_AUDIO_FORMAT = "flac"  # or "opus" for the smallest uploads
+# Extract and compact document text locally before upload. Off by default: plain
+# text loses the tables and layout file_search gets from the original PDF/DOCX
+PREPROCESS_DOCUMENTS = _setting(
+    "documents", "preprocess", "PREPROCESS_DOCUMENTS", "false"
+).lower() in ("1", "true", "yes")
+# Pre-answer likely follow-up questions in the background (costs extra tokens)
+SPECULATIVE_PREFETCH = _setting(
+    "speculation", "enabled", "SPECULATIVE_PREFETCH", "false"
+).lower() in ("1", "true", "yes")
+# Optional metrics exporters: a Prometheus port and/or a JSON-lines file
+METRICS_PORT = _setting("metrics", "port", "METRICS_PORT", "")
+METRICS_JSONL_PATH = _setting("metrics", "jsonl_path", "METRICS_JSONL_PATH", "")
+METRICS_FLUSH_INTERVAL = float(
+    _setting("metrics", "flush_interval", "METRICS_FLUSH_INTERVAL", metrics.FLUSH_INTERVAL)
+)
+FOLLOWUP_INSTRUCTIONS = (
+    "An insurance agent is chatting with their virtual assistant. Given the agent's last question "
+    "and the assistant's reply, list the {n} questions the agent is most likely to ask next "
+    "(e.g. about another product tier, or how to explain it to the client by email). "
+    "Write them in the language of the conversation, one per line, without numbering."
+)
+
+@functools.lru_cache(maxsize=None)
+def _read_text(file_path, mtime):
+    with open(file_path, "r") as f:
+        return f.read()
+
+def load_instructions(file_path="assistant_role.txt"):
+    """
+    Loads assistant instructions from a text file.
+    Cached per process; an edit to the file (new mtime) is read again.
+    """
+    return _read_text(file_path, os.path.getmtime(file_path)).strip()
+
+ASSISTANT_FILE = "AssistantID.TXT"
+ASSISTANT_REGISTRY_FILE = "AssistantRegistry.json"
+FILE_INDEX_FILE = "FileIndex.json"
+VECTOR_STORE_FILE = "VectorStores.json"
+FAQ_INDEX_DIR = _setting("faq", "index_dir", "FAQ_INDEX_DIR", "faq_index")  # built with faq_index.py
+ASSISTANT_NAME = "GroupF_Assistant"
+
+@functools.lru_cache(maxsize=None)
+def get_client():
+    """
+    Process-wide Azure OpenAI client, so its connection pool survives reruns.
+    """
+    return AzureOpenAI(
+        api_key=AZURE_API_KEY,
+        azure_endpoint=AZURE_ENDPOINT,
+        api_version=AZURE_API_VERSION,
+    )
+
+# Initialize Azure OpenAI client
+client = get_client()
+
+# === HELPER FUNCTIONS ===
+
+@functools.lru_cache(maxsize=None)
+def get_assistant_registry():
+    """
+    Process-wide assistant registry, adopting the id in AssistantID.TXT if there is one.
+    """
+    return AssistantRegistry(client, ASSISTANT_REGISTRY_FILE, legacy_id_path=ASSISTANT_FILE)
+
+def load_or_create_assistant():
+    """
+    Return the assistant for the current instructions, model and tools.
+    The registry only calls the API when its record is older than the TTL, and
+    updates the assistant in place when assistant_role.txt or the model changed.
+    """
+    return get_assistant_registry().ensure({
+        "name": ASSISTANT_NAME,
+        "instructions": load_instructions(),
+        "model": MODEL_DEPLOYMENT,
+        "tools": [{"type": "file_search"}],
+    })
+
+def create_thread():
+    """
+    Create a new chat thread for conversation context.
+    """
+    return client.beta.threads.create()
+
+@functools.lru_cache(maxsize=None)
+def get_file_name_resolver():
+    """
+    Process-wide file_id -> filename cache used for citations.
+    Names of files this app uploaded come from the file index, without an API call.
+    """
+    return FileNameResolver(client, fallback=get_file_index().filename)
+
+def get_file_info(file_id):
+    """
+    Retrieve file name from file ID (for citation/source display).
+    """
+    return get_file_name_resolver().resolve([file_id])[file_id]
+
+class CitationTracker:
+    """
+    Maps `【n:m†source】` markers to sequential `[n]` references.
+    Annotations can be fed one at a time, so citations resolve while a reply streams in;
+    file names are fetched in the background and collected by `resolve_sources`.
+    """
+    MARKER_RE = re.compile(r"【\d+:\d+†source】")
+    PARTIAL_MARKER_RE = re.compile(r"【[^】]*$")
+
+    def __init__(self):
+        self.citation_map = {}
+        self.file_ids = []
+
+    def add(self, annotation):
+        if getattr(annotation, "type", "") != "file_citation":
+            return
+        file_citation = getattr(annotation, "file_citation", None)
+        file_id = getattr(file_citation, "file_id", None)
+        marker = getattr(annotation, "text", "")
+        if file_id and marker and marker not in self.citation_map:
+            n = len(self.citation_map) + 1
+            self.citation_map[marker] = n
+            self.file_ids.append(file_id)
+            get_file_name_resolver().prefetch([file_id])
+
+    def resolve_sources(self):
+        names = get_file_name_resolver().resolve(self.file_ids)
+        return [{"n": n, "file": names[file_id]} for n, file_id in enumerate(self.file_ids, start=1)]
+
+    def render(self, text, partial=False):
+        def replace_marker(match):
+            marker = match.group(0)
+            if marker in self.citation_map:
+                return f"[{self.citation_map[marker]}]"
+            return ""
+        if partial:
+            # Hide a marker that has only partially arrived
+            text = self.PARTIAL_MARKER_RE.sub("", text)
+        return self.MARKER_RE.sub(replace_marker, text)
+
+def cancel_run(thread_id, run_id):
+    """
+    Cancel a run server-side so it stops consuming quota.
+    """
+    client.beta.threads.runs.cancel(run_id, thread_id=thread_id)
+
+def send_and_get_response(assistant_id, thread_id, message, file_ids=None, on_delta=None, stream=True,
+                          idle_timeout=RUN_IDLE_TIMEOUT, handle=None, max_completion_tokens=None,
+                          max_prompt_tokens=None):
+    """
+    Send user message (and any file context) to the assistant and wait for the reply.
+    Handles run status and response parsing, including citations/sources.
+    In streaming mode the reply is read from run events and `on_delta` is called
+    with the partial cleaned text; the run fails if no event arrives for `idle_timeout` seconds.
+    When run through the RunScheduler, `handle` receives the run id (so the run can be
+    cancelled) and makes a retried call skip the message that was already added.
+    A run cut short by `max_completion_tokens` or `max_prompt_tokens` counts as failed.
+    """
+    attachments = (
+        [{"file_id": fid, "tools": [{"type": "file_search"}]} for fid in file_ids]
+        if file_ids else None
+    )
+    if handle is None or not handle.message_created:
+        with metrics.span("message_create"):
+            client.beta.threads.messages.create(
+                thread_id=thread_id,
+                role="user",
+                content=message,
+                attachments=attachments
+            )
+        if handle is not None:
+            handle.message_created = True
+    if handle is not None and handle.cancelled:
+        return ERROR_RUN_FAILED, []
+    run_options = {
+        name: value for name, value in (
+            ("max_completion_tokens", max_completion_tokens), ("max_prompt_tokens", max_prompt_tokens)
+        ) if value
+    }
+    if stream:
+        return _stream_response(assistant_id, thread_id, on_delta, idle_timeout, handle, run_options)
+    with metrics.span("run_create"):
+        run = client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id, **run_options)
+    if handle is not None:
+        handle.run_started(thread_id, run.id)
+    status_timer = metrics.StatusTimer()
+    status_timer.transition(run.status)
+    start_time = time.time()
+    while True:
+        with metrics.span("run_poll"):
+            run_status = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+        status_timer.transition(run_status.status)
+        if run_status.status == "completed":
+            break
+        elif run_status.status in ["failed", "cancelled", "expired", "incomplete"]:
+            _raise_if_rate_limited(run_status)
+            return ERROR_RUN_FAILED, []
+        if time.time() - start_time > idle_timeout:
+            metrics.inc("timeouts_total", stage="run")
+            handle.cancel() if handle is not None else cancel_run(thread_id, run.id)
+            return ERROR_TIMEOUT, []
+        time.sleep(1)
+    with metrics.span("messages_list"):
+        messages = client.beta.threads.messages.list(thread_id=thread_id)
+    last_message_obj = messages.data[0]
+    content_block = last_message_obj.content[0]
+    value = getattr(content_block.text, "value", "")
+    annotations = getattr(content_block.text, "annotations", [])
+    tracker = CitationTracker()
+    # Extract sources for citations
+    for annotation in annotations:
+        tracker.add(annotation)
+    return tracker.render(value), tracker.resolve_sources()
+
+def _raise_if_rate_limited(run):
+    """
+    Turn a run that failed on the rate limit into RunRateLimited, so the scheduler retries it.
+    """
+    last_error = getattr(run, "last_error", None)
+    if getattr(last_error, "code", None) == "rate_limit_exceeded":
+        raise RunRateLimited()
+
+def _stream_response(assistant_id, thread_id, on_delta, idle_timeout, handle=None, run_options=None):
+    """
+    Run the assistant with event streaming, accumulating text deltas of the reply.
+    The request read timeout acts as the idle timeout between two events;
+    a run that goes idle is cancelled server-side.
+    """
+    tracker = CitationTracker()
+    value = ""
+    run_id = None
+    status_timer = metrics.StatusTimer()
+    started = time.perf_counter()
+    try:
+        with metrics.span("run_stream"), client.beta.threads.runs.stream(
+            thread_id=thread_id,
+            assistant_id=assistant_id,
+            timeout=idle_timeout,
+            **(run_options or {}),
+        ) as events:
+            for event in events:
+                if event.event.startswith("thread.run.") and not event.event.startswith("thread.run.step"):
+                    status_timer.transition(event.data.status)
+                if event.event == "thread.run.created":
+                    run_id = event.data.id
+                    if handle is not None:
+                        handle.run_started(thread_id, run_id)
+                if event.event in RUN_FAILED_EVENTS:
+                    if event.event == "thread.run.failed":
+                        _raise_if_rate_limited(event.data)
+                    return ERROR_RUN_FAILED, []
+                if event.event != "thread.message.delta":
+                    continue
+                for block in event.data.delta.content or []:
+                    if getattr(block, "type", "") != "text" or block.text is None:
+                        continue
+                    if not value and block.text.value:
+                        metrics.observe("time_to_first_token_seconds", time.perf_counter() - started)
+                    value += block.text.value or ""
+                    for annotation in block.text.annotations or []:
+                        tracker.add(annotation)
+                if on_delta:
+                    on_delta(tracker.render(value, partial=True))
+    except APITimeoutError:
+        metrics.inc("timeouts_total", stage="run")
+        if handle is not None:
+            handle.cancel()
+        elif run_id is not None:
+            cancel_run(thread_id, run_id)
+        return ERROR_TIMEOUT, []
+    return tracker.render(value), tracker.resolve_sources()
+
+@functools.lru_cache(maxsize=None)
+def get_answer_cache():
+    """
+    Process-wide semantic cache of answers, shared by all agents.
+    """
+    return AnswerCache()
+
+@functools.lru_cache(maxsize=None)
+def get_faq_index():
+    """
+    Process-wide local FAQ index, or None when none has been built.
+    """
+    if not os.path.exists(os.path.join(FAQ_INDEX_DIR, "meta.json")):
+        return None
+    return FAQIndex(FAQ_INDEX_DIR)
+
+def lookup_faq(message):
+    """
+    Answer from the local FAQ index when the knowledge documents match confidently.
+    Returns (reply, sources) or None.
+    """
+    index = get_faq_index()
+    if index is None:
+        return None
+    with metrics.span("faq_lookup", api=False):
+        hit = index.lookup(message)
+    metrics.cache_result("faq", hit is not None)
+    return hit
+
+@functools.lru_cache(maxsize=None)
+def get_background_pool():
+    """
+    Small shared pool for fire-and-forget API calls.
+    """
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="background")
+
+@functools.lru_cache(maxsize=None)
+def get_run_scheduler():
+    """
+    Process-wide run scheduler shared by all sessions.
+    """
+    return RunScheduler(cancel_run)
+
+def run_scheduled(thread_id, job, on_delta=None, background=False):
+    """
+    Run `job(handle, on_partial)` through the shared scheduler and wait for its result.
+    Partial replies are produced on a worker thread, so they are relayed through a
+    queue and rendered from the script thread. `background` runs yield to agents' runs.
+    """
+    partials = queue.Queue()
+    try:
+        future = get_run_scheduler().submit(
+            thread_id, lambda handle: job(handle, partials.put), deployment=MODEL_DEPLOYMENT,
+            background=background,
+        )
+    except SchedulerBusy:
+        return ERROR_BUSY, []
+    while True:
+        try:
+            result = future.result(timeout=0.05)
+            break
+        except FuturesTimeout:
+            pass
+        except (CancelledError, RateLimitError, RunRateLimited):
+            return ERROR_RUN_FAILED, []
+        finally:
+            latest = None
+            while not partials.empty():
+                latest = partials.get_nowait()
+            if latest is not None and on_delta:
+                on_delta(latest)
+    return result
+
+def record_cached_turn(thread_id, message, reply):
+    """
+    Append a cache-served question and answer to the thread, so later runs keep the context.
+    """
+    client.beta.threads.messages.create(thread_id=thread_id, role="user", content=message)
+    client.beta.threads.messages.create(thread_id=thread_id, role="assistant", content=reply)
+
+def summarize_turns(plan):
+    """
+    Summarise the turns being dropped from the thread (and any earlier summary).
+    """
+    response = client.chat.completions.create(
+        model=MODEL_DEPLOYMENT,
+        messages=[
+            {"role": "system", "content": CONTEXT_SUMMARY_INSTRUCTIONS},
+            {"role": "user", "content": plan.transcript()},
+        ],
+        max_tokens=CONTEXT_SUMMARY_MAX_TOKENS,
+        temperature=0,
+    )
+    return response.choices[0].message.content.strip()
+
+def compact_thread(plan, vector_store_id=None):
+    """
+    Create a fresh thread seeded with a summary of the older turns and the recent ones verbatim.
+    Returns the new thread and the summary.
+    """
+    summary = summarize_turns(plan)
+    extra = {}
+    if vector_store_id:
+        extra["tool_resources"] = {"file_search": {"vector_store_ids": [vector_store_id]}}
+    thread = client.beta.threads.create(messages=plan.seed_messages(summary), **extra)
+    return thread, summary
+
+def suggest_followups(question, reply, n, max_tokens):
+    """
+    Ask the model for the `n` follow-up questions the agent is most likely to ask next.
+    """
+    response = client.chat.completions.create(
+        model=MODEL_DEPLOYMENT,
+        messages=[
+            {"role": "system", "content": FOLLOWUP_INSTRUCTIONS.format(n=n)},
+            {"role": "user", "content": f"Question: {question}\n\nReply: {reply}"},
+        ],
+        max_tokens=max_tokens,
+        temperature=0.3,
+    )
+    lines = (response.choices[0].message.content or "").splitlines()
+    return [line.strip(" -*0123456789.)") for line in lines if line.strip(" -*0123456789.)")]
+
+def answer_followup(context, followup, max_tokens, max_prompt_tokens):
+    """
+    Answer a predicted follow-up on a throwaway thread seeded with the last exchange,
+    so the agent's own thread is untouched. The run goes through the shared scheduler
+    as background work, behind every agent's run. Returns (reply, sources), or None on failure.
+    """
+    assistant_id, question, reply, vector_store_id = context
+    extra = {}
+    if vector_store_id:
+        extra["tool_resources"] = {"file_search": {"vector_store_ids": [vector_store_id]}}
+    thread = client.beta.threads.create(
+        messages=[{"role": "user", "content": question}, {"role": "assistant", "content": reply}], **extra
+    )
+    try:
+        result = run_scheduled(
+            thread.id,
+            lambda handle, on_partial: send_and_get_response(
+                assistant_id, thread.id, followup, handle=handle,
+                max_completion_tokens=max_tokens, max_prompt_tokens=max_prompt_tokens,
+            ),
+            background=True,
+        )
+    finally:
+        get_background_pool().submit(client.beta.threads.delete, thread.id)
+    return None if result[0] in RUN_ERRORS else result
+
+@functools.lru_cache(maxsize=None)
+def get_followup_prefetcher():
+    """
+    Process-wide speculative follow-up prefetcher (concurrency and token budget are shared).
+    """
+    return FollowupPrefetcher(suggest_followups, answer_followup)
+
+@functools.lru_cache(maxsize=None)
+def get_whisper_client():
+    """
+    Process-wide Whisper client with a pooled, retrying HTTP session.
+    """
+    from transcription import WhisperClient
+    return WhisperClient(OPENAI_KEY, base_url=WHISPER_BASE_URL, audio_format=WHISPER_AUDIO_FORMAT)
+
+def whisper_api_transcribe(audio, language="pt"):
+    """
+    Transcribe audio using OpenAI Whisper API.
+    `audio` is a WAV file path or a binary file-like object.
+    Returns the recognized text.
+    """
+    if isinstance(audio, str):
+        with open(audio, "rb") as f:
+            return whisper_api_transcribe(f, language)
+    return get_whisper_client().transcribe_file("audio.wav", audio, "audio/wav", language=language)
+
+def transcribe_pcm(pcm, sample_rate, language="pt"):
+    """
+    Transcribe one segment of int16 mono audio, compressed in memory before upload.
+    """
+    return get_whisper_client().transcribe_pcm(pcm, sample_rate, language=language)
+
+@functools.lru_cache(maxsize=None)
+def get_file_index():
+    """
+    Process-wide content hash -> file id index, shared by all sessions.
+    """
+    return FileIndex(FILE_INDEX_FILE)
+
+@functools.lru_cache(maxsize=None)
+def get_vector_store_manager():
+    """
+    Process-wide vector store registry; expired stores are cleaned up once per process.
+    """
+    manager = VectorStoreManager(client, VECTOR_STORE_FILE)
+    manager.cleanup()
+    return manager
+
+def upload_files_to_assistant(files, preprocess=PREPROCESS_DOCUMENTS, on_report=None):
+    """
+    Upload files to OpenAI for assistant context and return (content hash, file ID) pairs.
+    Files are deduplicated by content hash, so bytes already uploaded (on any
+    rerun or session) reuse their file ID; new files upload concurrently from memory.
+    With `preprocess`, documents are first reduced to compact text (a large one may
+    become several files) and `on_report` receives the PreprocessReport.
+    """
+    items = [(file.name, file.getvalue()) for file in files]
+    with metrics.span("upload", api=False):
+        if preprocess:
+            documents, report = preprocess_documents(items)
+            items = [(doc.upload_name, doc.data) for doc in documents]
+            display_names = [doc.display_name for doc in documents]
+            if on_report:
+                on_report(report)
+        else:
+            display_names = [name for name, _ in items]
+        pairs = get_file_index().upload_all(client, items, display_names=display_names)
+    # Citations of these files then never need a files.retrieve
+    resolver = get_file_name_resolver()
+    for display_name, (_digest, file_id) in zip(display_names, pairs):
+        resolver.seed(file_id, display_name)
+    return pairs
+
+def vector_store_for(files, pairs):
+    """
+    Return the vector store id for `files` (uploaded as the (digest, file ID) `pairs`)
+    and the pairs. Files deleted server-side are dropped from the file index and
+    uploaded again, instead of failing every store built with their dead IDs.
+    """
+    manager = get_vector_store_manager()
+    try:
+        return manager.get_or_create(pairs), pairs
+    except StaleFilesError as exc:
+        metrics.inc("stale_files_total", len(exc.file_ids))
+        index = get_file_index()
+        for file_id in exc.file_ids:
+            index.forget(file_id)
+        pairs = upload_files_to_assistant(files)
+        return manager.get_or_create(pairs), pairs
@@ -0,0 +1,154 @@
+"""
+Assistant provisioning registry
+-------------------------------
+Records the provisioned assistant (id, model, tools and a hash of its
+definition) in a local JSON file. The assistant is checked against the API at
+most once per TTL, shared by every worker process through the file, instead of
+on every session. When the instructions, model or tools change, the existing
+assistant is updated in place. A file lock keeps several workers starting at
+once from creating or updating the assistant twice.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from openai import NotFoundError
+import metrics
+
+ASSISTANT_REGISTRY_TTL = 3600  # seconds between checks of the assistant against the API
+
+
+def spec_hash(spec):
+    """
+    Stable hash of an assistant definition (name, instructions, model, tools).
+    """
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Exclusive lock on `path` shared between processes (flock, or msvcrt on Windows).
+    """
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class AssistantRecord:
+    """
+    What the app needs of the assistant; built from the registry without an API call.
+    """
+    def __init__(self, id, model, tools, spec_hash, validated_at):
+        self.id = id
+        self.model = model
+        self.tools = tools
+        self.spec_hash = spec_hash
+        self.validated_at = validated_at
+
+    def to_dict(self):
+        return {"id": self.id, "model": self.model, "tools": self.tools,
+                "spec_hash": self.spec_hash, "validated_at": self.validated_at}
+
+
+class AssistantRegistry:
+    """
+    Process-wide access to the registry file. `ensure(spec)` returns the assistant
+    matching `spec`, provisioning or updating it only when needed.
+    """
+    def __init__(self, client, path, legacy_id_path=None, ttl=ASSISTANT_REGISTRY_TTL):
+        self.client = client
+        self.path = path
+        self.legacy_id_path = legacy_id_path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._record = None
+
+    def ensure(self, spec):
+        digest = spec_hash(spec)
+        with self._lock:
+            if self._is_fresh(self._record, digest):
+                metrics.cache_result("assistant_registry", True)
+                return self._record
+            with file_lock(f"{self.path}.lock"):
+                # Another worker may have validated or provisioned it meanwhile
+                record = self._read()
+                hit = self._is_fresh(record, digest)
+                metrics.cache_result("assistant_registry", hit)
+                if not hit:
+                    record = self._provision(record, spec, digest)
+                    self._write(record)
+            self._record = record
+            return record
+
+    def _is_fresh(self, record, digest):
+        return (
+            record is not None
+            and record.spec_hash == digest
+            and time.time() - record.validated_at < self.ttl
+        )
+
+    def _provision(self, record, spec, digest):
+        """
+        Check the known assistant, update it if its definition changed, or create one.
+        """
+        assistant_id = record.id if record else self._legacy_id()
+        if assistant_id:
+            try:
+                if record is not None and record.spec_hash == digest:
+                    with metrics.span("assistant_retrieve"):
+                        assistant = self.client.beta.assistants.retrieve(assistant_id)
+                else:
+                    # Definition changed (or unknown, from AssistantID.TXT): update in place
+                    with metrics.span("assistant_update"):
+                        assistant = self.client.beta.assistants.update(assistant_id, **spec)
+                return self._record_for(assistant, spec, digest)
+            except NotFoundError:
+                pass  # deleted remotely; provision a new one
+        with metrics.span("assistant_create"):
+            assistant = self.client.beta.assistants.create(**spec)
+        return self._record_for(assistant, spec, digest)
+
+    @staticmethod
+    def _record_for(assistant, spec, digest):
+        return AssistantRecord(assistant.id, spec["model"], spec["tools"], digest, time.time())
+
+    def _legacy_id(self):
+        if self.legacy_id_path and os.path.exists(self.legacy_id_path):
+            with open(self.legacy_id_path, "r") as f:
+                return f.read().strip() or None
+        return None
+
+    def _read(self):
+        try:
+            with open(self.path, "r") as f:
+                return AssistantRecord(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def _write(self, record):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(record.to_dict(), f)
+        os.replace(tmp_path, self.path)
+        if self.legacy_id_path:
+            # Kept for tools that still read the bare id
+            with open(self.legacy_id_path, "w") as f:
+                f.write(record.id)
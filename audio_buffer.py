@@ -0,0 +1,166 @@
+"""
+Bounded audio capture buffer
+----------------------------
+Stores microphone audio as 16 kHz mono int16 in a preallocated NumPy array.
+Incoming frames are downmixed and resampled as they arrive, the array grows by
+doubling up to a configurable maximum duration and then keeps only the most
+recent audio (ring buffer), so a long recording never grows without limit.
+"""
+
+import threading
+import numpy as np
+
+TARGET_SAMPLE_RATE = 16000  # what Whisper works with internally
+MAX_RECORDING_SECONDS = 300
+INITIAL_BUFFER_SECONDS = 10
+
+
+def frame_to_mono(samples, channels, planar):
+    """
+    Downmix a decoded frame to a 1-D float32 array in [-1, 1].
+    Planar frames are shaped (channels, n); packed frames are (1, n * channels) interleaved.
+    """
+    if np.issubdtype(samples.dtype, np.integer):
+        scale = float(np.iinfo(samples.dtype).max) + 1.0
+        samples = samples.astype(np.float32) / scale
+    else:
+        samples = samples.astype(np.float32, copy=False)
+    if planar:
+        return samples.mean(axis=0) if samples.shape[0] > 1 else samples[0]
+    samples = samples.reshape(-1, channels)
+    return samples.mean(axis=1) if channels > 1 else samples[:, 0]
+
+
+class Resampler:
+    """
+    Streaming resampler. Integer ratios (e.g. 48 kHz -> 16 kHz) average blocks of
+    samples, which also acts as a crude anti-aliasing filter; other ratios use
+    linear interpolation. Leftover input is carried over to the next chunk.
+    """
+    def __init__(self, source_rate, target_rate=TARGET_SAMPLE_RATE):
+        self.source_rate = source_rate
+        self.target_rate = target_rate
+        self._carry = np.zeros(0, dtype=np.float32)
+        self._position = 0.0  # next output position, in input samples relative to the carry
+        if source_rate % target_rate == 0:
+            self._factor = source_rate // target_rate
+        else:
+            self._factor = None
+
+    def process(self, samples):
+        samples = np.concatenate((self._carry, samples)) if self._carry.size else samples
+        if self.source_rate == self.target_rate:
+            return samples
+        if self._factor:
+            usable = samples.size - samples.size % self._factor
+            self._carry = samples[usable:].copy()
+            return samples[:usable].reshape(-1, self._factor).mean(axis=1)
+        step = self.source_rate / self.target_rate
+        positions = np.arange(self._position, samples.size - 1, step)
+        out = np.interp(positions, np.arange(samples.size), samples).astype(np.float32)
+        next_position = self._position + positions.size * step
+        keep_from = int(next_position)
+        self._carry = samples[keep_from:].copy()
+        self._position = next_position - keep_from
+        return out
+
+
+class AudioBuffer:
+    """
+    Thread-safe, growable ring buffer of 16 kHz mono int16 samples.
+    Frames are appended from the WebRTC worker thread and read from the script thread.
+    """
+    def __init__(self, max_seconds=MAX_RECORDING_SECONDS, sample_rate=TARGET_SAMPLE_RATE,
+                 initial_seconds=INITIAL_BUFFER_SECONDS):
+        self.sample_rate = sample_rate
+        self.capacity = int(max_seconds * sample_rate)
+        self._data = np.zeros(min(self.capacity, int(initial_seconds * sample_rate)), dtype=np.int16)
+        self._write = 0  # next write index
+        self._size = 0  # valid samples stored
+        self._total = 0  # samples ever appended, including overwritten ones
+        self._resampler = None
+        self._lock = threading.Lock()
+
+    def append_frame(self, frame):
+        """
+        Append an `av.AudioFrame`, using the frame's own sample rate and layout.
+        """
+        samples = frame_to_mono(
+            frame.to_ndarray(), len(frame.layout.channels), frame.format.is_planar
+        )
+        self.append(samples, frame.sample_rate)
+
+    def append(self, samples, source_rate):
+        """
+        Append mono float samples recorded at `source_rate`.
+        """
+        with self._lock:
+            if self._resampler is None or self._resampler.source_rate != source_rate:
+                self._resampler = Resampler(source_rate, self.sample_rate)
+            pcm = np.clip(self._resampler.process(samples), -1.0, 1.0)
+            self._write_pcm((pcm * 32767.0).astype(np.int16))
+
+    def _write_pcm(self, pcm):
+        if pcm.size >= self.capacity:
+            pcm = pcm[-self.capacity:]
+        self._total += pcm.size
+        needed = self._size + pcm.size
+        if needed > self._data.size and self._data.size < self.capacity:
+            self._grow(min(self.capacity, max(needed, self._data.size * 2)))
+        end = self._write + pcm.size
+        if end <= self._data.size:
+            self._data[self._write:end] = pcm
+        else:
+            first = self._data.size - self._write
+            self._data[self._write:] = pcm[:first]
+            self._data[:pcm.size - first] = pcm[first:]
+        self._write = end % self._data.size
+        self._size = min(self._data.size, self._size + pcm.size)
+
+    def _grow(self, new_size):
+        # Only reached before the ring has wrapped, so the data is contiguous from 0
+        grown = np.zeros(new_size, dtype=np.int16)
+        grown[:self._size] = self._data[:self._size]
+        self._data = grown
+        self._write = self._size
+
+    def to_array(self, start=0, end=None):
+        """
+        Return the buffered samples in chronological order, from absolute sample
+        index `start` (clamped to the oldest sample still held) up to `end`.
+        Only the requested samples are copied.
+        """
+        with self._lock:
+            oldest = self._total - self._size
+            skip = max(0, start - oldest)
+            stop = self._size if end is None else min(self._size, end - oldest)
+            if skip >= stop:
+                return np.zeros(0, dtype=np.int16)
+            if self._size < self._data.size:
+                return self._data[skip:stop].copy()
+            # Wrapped: the oldest samples are at the write index, the newest just before it
+            head = self._data.size - self._write
+            if stop <= head:
+                return self._data[self._write + skip:self._write + stop].copy()
+            if skip >= head:
+                return self._data[skip - head:stop - head].copy()
+            return np.concatenate((self._data[self._write + skip:], self._data[:stop - head]))
+
+    @property
+    def total_samples(self):
+        with self._lock:
+            return self._total
+
+    @property
+    def duration(self):
+        with self._lock:
+            return self._size / self.sample_rate
+
+    def clear(self):
+        with self._lock:
+            self._write = self._size = self._total = 0
+            self._resampler = None
+
+    def __len__(self):
+        with self._lock:
+            return self._size
@@ -0,0 +1,26 @@
+"""
+WebRTC audio processor
+----------------------
+Kept out of app.py so streamlit_webrtc and PyAV are only imported once an
+agent actually turns on the microphone.
+"""
+
+import av
+from streamlit_webrtc import AudioProcessorBase
+from audio_buffer import AudioBuffer, MAX_RECORDING_SECONDS
+from streaming_transcription import SegmentingTranscriber
+
+
+class AudioProcessor(AudioProcessorBase):
+    """
+    Custom audio processor for WebRTC audio frames.
+    Collects audio into a bounded 16 kHz mono buffer and transcribes each
+    utterance in the background while the agent is still speaking.
+    """
+    def __init__(self, transcribe, max_seconds=MAX_RECORDING_SECONDS, language="pt"):
+        self.buffer = AudioBuffer(max_seconds=max_seconds)
+        self.transcriber = SegmentingTranscriber(self.buffer, transcribe, language=language)
+    def recv_audio(self, frame: av.AudioFrame) -> av.AudioFrame:
+        self.buffer.append_frame(frame)
+        self.transcriber.update()
+        return frame
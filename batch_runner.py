@@ -0,0 +1,190 @@
+"""
+Batch question runner
+---------------------
+Headless counterpart of the chat page: answers a JSONL file of questions with
+the same assistant and code paths (load_or_create_assistant,
+send_and_get_response through the shared run scheduler), a few at a time, and
+appends each answer with its sources to an output JSONL as soon as it is ready.
+Ids already answered in the output are skipped, so a crashed or interrupted
+batch resumes where it stopped. Used to pre-generate FAQ answers and to
+regression-check changes to assistant_role.txt.
+
+Input lines look like
+    {"id": "faq-001", "question": "Que coberturas inclui o seguro automóvel?", "files": ["docs/auto.pdf"]}
+where "files" is optional and relative to the input file.
+
+    python batch_runner.py questions.jsonl answers.jsonl --workers 4
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import assistant_core as core
+
+DEFAULT_WORKERS = 4
+
+
+class LocalFile:
+    """
+    A document on disk, with the `.name`/`.getvalue()` interface of Streamlit uploads.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+
+    def getvalue(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+
+def read_questions(path, id_field="id", question_field="question"):
+    """
+    Yield (id, question, file paths) from a JSONL file, skipping blank lines.
+    """
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if id_field not in record or question_field not in record:
+                raise ValueError(f"{path}:{line_no}: missing '{id_field}' or '{question_field}'")
+            files = [os.path.join(base_dir, p) for p in record.get("files") or []]
+            yield str(record[id_field]), record[question_field], files
+
+
+def completed_ids(path):
+    """
+    Ids with a successful answer in an existing output file (a torn last line is ignored).
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("error") is None:
+                done.add(record["id"])
+            else:
+                done.discard(record["id"])
+    return done
+
+
+class ResultWriter:
+    """
+    Appends one JSON line per result and flushes it to disk, so a crash loses at most the line in flight.
+    """
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def answer_one(assistant_id, question_id, question, files, role_hash):
+    """
+    Answer one question on a fresh thread, with its own documents bound when it has any.
+    """
+    start = time.perf_counter()
+    thread = core.create_thread()
+    file_ids = []
+    if files:
+        local_files = [LocalFile(p) for p in files]
+        store_id, pairs = core.vector_store_for(local_files, core.upload_files_to_assistant(local_files))
+        core.get_vector_store_manager().bind_to_thread(thread.id, store_id)
+        file_ids = [file_id for _, file_id in pairs]
+    reply, sources = core.run_scheduled(
+        thread.id,
+        lambda handle, on_partial: core.send_and_get_response(
+            assistant_id, thread.id, question, handle=handle
+        ),
+    )
+    return {
+        "id": question_id,
+        "question": question,
+        "answer": None if reply in core.RUN_ERRORS else reply,
+        "sources": sources,
+        "error": reply if reply in core.RUN_ERRORS else None,
+        "file_ids": file_ids,
+        "thread_id": thread.id,
+        "assistant_id": assistant_id,
+        "role_hash": role_hash,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def run_batch(input_path, output_path, workers=DEFAULT_WORKERS, id_field="id", question_field="question",
+              limit=None):
+    """
+    Answer every question in `input_path` not yet answered in `output_path`.
+    Returns (answered, failed, skipped) counts.
+    """
+    questions = list(read_questions(input_path, id_field, question_field))
+    done = completed_ids(output_path)
+    todo = [q for q in questions if q[0] not in done]
+    skipped = len(questions) - len(todo)
+    if limit is not None:
+        todo = todo[:limit]
+    assistant_id = core.load_or_create_assistant().id
+    role_hash = hashlib.sha256(core.load_instructions().encode("utf-8")).hexdigest()[:12]
+    writer = ResultWriter(output_path)
+    answered = failed = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as pool:
+            futures = {
+                pool.submit(answer_one, assistant_id, qid, question, files, role_hash): (qid, question)
+                for qid, question, files in todo
+            }
+            for future in as_completed(futures):
+                qid, question = futures[future]
+                try:
+                    record = future.result()
+                except Exception as exc:
+                    record = {"id": qid, "question": question, "answer": None, "sources": [],
+                              "error": f"{type(exc).__name__}: {exc}", "role_hash": role_hash}
+                writer.write(record)
+                if record["error"] is None:
+                    answered += 1
+                else:
+                    failed += 1
+                print(f"[{answered + failed}/{len(todo)}] {qid}: {'ok' if record['error'] is None else record['error']}",
+                      file=sys.stderr)
+    finally:
+        writer.close()
+    return answered, failed, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions with the assistant.")
+    parser.add_argument("input", help="JSONL file of questions")
+    parser.add_argument("output", help="JSONL file results are appended to (existing ids are skipped)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="questions answered in parallel")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--question-field", default="question")
+    parser.add_argument("--limit", type=int, help="answer at most this many new questions")
+    args = parser.parse_args()
+    answered, failed, skipped = run_batch(
+        args.input, args.output, args.workers, args.id_field, args.question_field, args.limit
+    )
+    print(f"answered {answered}, failed {failed}, skipped {skipped} already done", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Load-test benchmark
+-------------------
+Drives N concurrent simulated sessions through the real assistant code paths
+(send_and_get_response via the shared run scheduler, upload_files_to_assistant
+and whisper_api_transcribe) against the local mock backend, then reports
+throughput and p50/p95/p99 latency per operation. Results can be saved as JSON
+and compared with a saved baseline to catch regressions before a rollout.
+
+    python benchmark.py --sessions 20 --turns 3 --json run.json
+    python benchmark.py --sessions 20 --baseline run.json --tolerance 0.2
+
+Without --base-url a mock backend is started in-process (see mock_backend.py).
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import wave
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import mock_backend
+
+OPERATIONS = ("session", "thread_create", "upload", "message", "transcribe")
+PERCENTILES = (50, 95, 99)
+
+
+class NamedBytes(io.BytesIO):
+    """
+    Stand-in for a Streamlit UploadedFile: `.name` plus `.getvalue()`.
+    """
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+
+
+def make_wav(seconds, sample_rate=16000):
+    """
+    A synthetic mono 16-bit WAV (a tone with some noise) of the given length.
+    """
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    signal = 0.3 * np.sin(2 * np.pi * 220 * t) + 0.02 * np.random.default_rng(0).standard_normal(t.size)
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes((signal * 32767).astype(np.int16).tobytes())
+    return buf.getvalue()
+
+
+class Recorder:
+    """
+    Thread-safe collection of (operation, seconds, ok) samples.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {op: [] for op in OPERATIONS}
+        self.errors = {op: 0 for op in OPERATIONS}
+
+    def time(self, op, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self.errors[op] += 1
+            raise
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.samples[op].append(elapsed)
+        return result
+
+    def fail(self, op):
+        with self._lock:
+            self.errors[op] += 1
+
+
+def run_session(core, assistant_id, recorder, index, args, audio):
+    """
+    One simulated agent: new thread, a document upload, a few questions and a voice note.
+    """
+    start = time.perf_counter()
+    thread = recorder.time("thread_create", core.create_thread)
+    file_ids = []
+    if args.upload_kb:
+        # Unique content per session, so uploads are not all deduplicated by the file index
+        data = (f"Documento de teste {index}\n".encode() * (args.upload_kb * 40))[: args.upload_kb * 1024]
+        pairs = recorder.time("upload", core.upload_files_to_assistant, [NamedBytes(f"doc_{index}.txt", data)])
+        file_ids = [file_id for _digest, file_id in pairs]
+    for turn in range(args.turns):
+        question = f"Sessão {index}, pergunta {turn}: que coberturas inclui o seguro automóvel?"
+
+        def job(handle, on_partial, question=question, file_ids=file_ids if turn == 0 else None):
+            return core.send_and_get_response(
+                assistant_id, thread.id, question, file_ids, on_delta=on_partial,
+                stream=not args.poll, handle=handle,
+            )
+
+        if args.direct:
+            reply, _sources = recorder.time("message", job, None, None)
+        else:
+            reply, _sources = recorder.time("message", core.run_scheduled, thread.id, job)
+        if reply in core.RUN_ERRORS:
+            recorder.fail("message")
+    if audio is not None:
+        recorder.time("transcribe", core.whisper_api_transcribe, io.BytesIO(audio))
+    recorder.samples["session"].append(time.perf_counter() - start)
+
+
+def summarize(recorder, wall_time):
+    """
+    Per-operation count, errors, throughput and latency percentiles (in ms).
+    """
+    report = {"wall_time": wall_time, "operations": {}}
+    for op in OPERATIONS:
+        samples = recorder.samples[op]
+        if not samples and not recorder.errors[op]:
+            continue
+        entry = {"count": len(samples), "errors": recorder.errors[op], "throughput": len(samples) / wall_time}
+        if samples:
+            values = np.percentile(np.array(samples) * 1000, PERCENTILES)
+            entry.update({f"p{p}": round(float(v), 1) for p, v in zip(PERCENTILES, values)})
+        report["operations"][op] = entry
+    return report
+
+
+def print_report(report):
+    print(f"\nWall time: {report['wall_time']:.2f}s")
+    print(f"{'operation':<14}{'count':>7}{'errors':>8}{'ops/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for op, entry in report["operations"].items():
+        print(f"{op:<14}{entry['count']:>7}{entry['errors']:>8}{entry['throughput']:>9.2f}"
+              f"{entry.get('p50', 0):>10.1f}{entry.get('p95', 0):>10.1f}{entry.get('p99', 0):>10.1f}")
+
+
+def compare(report, baseline, tolerance):
+    """
+    List regressions: a p95/p99 more than `tolerance` slower, or throughput that much lower.
+    """
+    regressions = []
+    for op, entry in report["operations"].items():
+        base = baseline.get("operations", {}).get(op)
+        if not base:
+            continue
+        for key in ("p95", "p99"):
+            if key in entry and key in base and entry[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{op} {key}: {entry[key]:.1f}ms vs {base[key]:.1f}ms baseline")
+        if entry["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{op} throughput: {entry['throughput']:.2f}/s vs {base['throughput']:.2f}/s baseline")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the assistant code paths against a mock backend.")
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent simulated sessions")
+    parser.add_argument("--turns", type=int, default=3, help="questions per session")
+    parser.add_argument("--upload-kb", type=int, default=32, help="document size per session (0 to skip)")
+    parser.add_argument("--audio-seconds", type=float, default=5.0, help="voice note per session (0 to skip)")
+    parser.add_argument("--poll", action="store_true", help="poll runs instead of streaming them")
+    parser.add_argument("--direct", action="store_true", help="bypass the run scheduler")
+    parser.add_argument("--base-url", help="use an already running backend instead of an in-process mock")
+    parser.add_argument("--latency-ms", type=float, default=40.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="compare with a report saved by --json")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown vs the baseline")
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        config = mock_backend.MockConfig(
+            latency_ms=args.latency_ms, failure_rate=args.failure_rate, rate_limit_rate=args.rate_limit_rate,
+            tokens_per_second=args.tokens_per_second, retry_after=0.2, seed=args.seed,
+        )
+        server, base_url = mock_backend.start_in_background(config)
+    # assistant_core reads its settings at import time
+    os.environ["AZURE_OPENAI_ENDPOINT"] = base_url
+    os.environ["AZURE_OPENAI_API_KEY"] = "benchmark"
+    os.environ["OPENAI_API_KEY"] = "benchmark"
+    os.environ["WHISPER_BASE_URL"] = base_url.rstrip("/") + "/v1"
+    import assistant_core as core
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Keep the benchmark's ids out of the app's local state files
+        core.ASSISTANT_FILE = os.path.join(workdir, "AssistantID.TXT")
+        core.ASSISTANT_REGISTRY_FILE = os.path.join(workdir, "AssistantRegistry.json")
+        core.FILE_INDEX_FILE = os.path.join(workdir, "FileIndex.json")
+        core.VECTOR_STORE_FILE = os.path.join(workdir, "VectorStores.json")
+        assistant_id = core.load_or_create_assistant().id
+        audio = make_wav(args.audio_seconds) if args.audio_seconds else None
+        recorder = Recorder()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+            futures = [pool.submit(run_session, core, assistant_id, recorder, i, args, audio)
+                       for i in range(args.sessions)]
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as exc:
+                    recorder.fail("session")
+                    print(f"session failed: {type(exc).__name__}: {exc}", file=sys.stderr)
+        report = summarize(recorder, time.perf_counter() - start)
+    if server is not None:
+        server.shutdown()
+
+    report["config"] = {k: v for k, v in vars(args).items() if k not in ("json", "baseline")}
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+Chat message records
+--------------------
+The chat history is a list of ChatMessage records rather than ad-hoc tuples:
+one fixed, slots-based shape for user and assistant turns, so hundreds of
+turns stay small in session state and every consumer (rendering, PDF export)
+reads the same fields.
+"""
+
+import time
+
+
+class ChatMessage:
+    """
+    One chat turn. `sources` are the `{"n", "file"}` citations of an assistant reply.
+    For a reply, `created_at` is when the question was asked and `completed_at` when the reply finished.
+    """
+    __slots__ = ("role", "text", "sources", "created_at", "completed_at")
+
+    def __init__(self, role, text, sources=(), created_at=None, completed_at=None):
+        self.role = role
+        self.text = text
+        self.sources = tuple(sources)
+        now = time.time()
+        self.created_at = now if created_at is None else created_at
+        self.completed_at = now if completed_at is None else completed_at
+
+    def __repr__(self):
+        return f"ChatMessage({self.role!r}, {self.text[:40]!r})"
+
+
+def history_window(history, page_size, pages):
+    """
+    The last `pages * page_size` messages, and how many older ones are hidden.
+    """
+    shown = page_size * pages
+    hidden = max(len(history) - shown, 0)
+    return history[hidden:], hidden
@@ -0,0 +1,102 @@
+"""
+Thread context windowing
+------------------------
+Every run re-reads the whole thread, so prompt size and latency grow with the
+conversation. ContextWindow keeps an approximate token count of the turns on
+the current thread; past a threshold the older turns are rolled into a summary
+and the conversation moves to a fresh thread seeded with that summary and the
+most recent turns. The full transcript stays in the local chat history.
+"""
+
+CONTEXT_MAX_TOKENS = 6000  # approximate thread size that triggers compaction
+CONTEXT_KEEP_TURNS = 2  # most recent question/answer pairs replayed verbatim
+CHARS_PER_TOKEN = 4  # rough average for Portuguese/English text
+SUMMARY_PREFIX = "Resumo da conversa anterior / Summary of the earlier conversation:\n"
+
+
+def estimate_tokens(text):
+    """
+    Cheap token estimate, good enough to decide when to compact.
+    """
+    return len(text) // CHARS_PER_TOKEN + 4  # per-message overhead
+
+
+class CompactionPlan:
+    """
+    Snapshot of what one compaction summarizes and what it keeps verbatim.
+    """
+    def __init__(self, summary, older, recent):
+        self.summary = summary
+        self.older = older
+        self.recent = recent
+
+    def transcript(self):
+        """
+        Plain-text transcript of the turns to summarize, including any earlier summary.
+        """
+        lines = [self.summary] if self.summary else []
+        for question, reply in self.older:
+            lines.append(f"User: {question}")
+            lines.append(f"Assistant: {reply}")
+        return "\n".join(lines)
+
+    def seed_messages(self, new_summary):
+        """
+        Messages for the new thread: the summary, then the recent turns.
+        """
+        messages = [{"role": "assistant", "content": SUMMARY_PREFIX + new_summary}]
+        for question, reply in self.recent:
+            messages.append({"role": "user", "content": question})
+            messages.append({"role": "assistant", "content": reply})
+        return messages
+
+
+class ContextWindow:
+    """
+    Per-session bookkeeping of the turns currently on the assistant thread.
+    """
+    def __init__(self, max_tokens=CONTEXT_MAX_TOKENS, keep_turns=CONTEXT_KEEP_TURNS):
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.summary = None
+        self.turns = []  # (question, reply, tokens)
+
+    @property
+    def tokens(self):
+        summary_tokens = estimate_tokens(self.summary) if self.summary else 0
+        return summary_tokens + sum(tokens for _, _, tokens in self.turns)
+
+    def add_turn(self, question, reply):
+        self.turns.append((question, reply, estimate_tokens(question) + estimate_tokens(reply)))
+
+    def needs_compaction(self):
+        return self.tokens > self.max_tokens and len(self.turns) > self.keep_turns
+
+    def plan_compaction(self):
+        split = len(self.turns) - self.keep_turns
+        return CompactionPlan(
+            self.summary,
+            [(q, r) for q, r, _ in self.turns[:split]],
+            [(q, r) for q, r, _ in self.turns[split:]],
+        )
+
+    def apply_compaction(self, plan, new_summary):
+        """
+        Record that the turns in `plan.older` now live only in the summary.
+        """
+        self.summary = new_summary
+        self.turns = self.turns[len(plan.older):]
+
+    def to_state(self):
+        """
+        JSON-friendly snapshot, for the session store.
+        """
+        return {"summary": self.summary, "turns": [[q, r] for q, r, _ in self.turns]}
+
+    @classmethod
+    def from_state(cls, state, **kwargs):
+        window = cls(**kwargs)
+        window.summary = state.get("summary")
+        for question, reply in state.get("turns", []):
+            window.add_turn(question, reply)
+        return window
@@ -0,0 +1,260 @@
+"""
+Document preprocessing
+----------------------
+Optional stage before upload that turns PDF, DOCX, CSV and text documents into
+compact plain text: whitespace is normalized, running headers and footers
+(lines repeated at the top or bottom of many pages of a PDF) are kept only
+once, duplicate pages are dropped, and very large documents are split into
+bounded parts. Each document is processed on its own, so its uploaded bytes
+(and file id) do not change when other files join the batch. Extraction
+runs in a process pool, off the Streamlit script thread. Each part keeps the
+original filename as its display name, so citations still name the document
+the agent uploaded. Anything that cannot be extracted, or whose text would not
+be smaller, is uploaded unchanged. Results are cached per file by the SHA-256
+of its original bytes, since Streamlit submits the same uploads on every rerun.
+"""
+
+import io
+import os
+import csv
+import hashlib
+import functools
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from ttl_cache import TTLCache
+import metrics
+
+PREPROCESS_EXTENSIONS = (".pdf", ".docx", ".csv", ".txt", ".md")
+PREPROCESS_MAX_CHARS = 400_000  # per uploaded part
+PREPROCESS_WORKERS = 2
+BOILERPLATE_MIN_PAGES = 3  # a header/footer line on this many pages of a document is boilerplate
+BOILERPLATE_EDGE_LINES = 2  # lines at the top and at the bottom of a page that may be header/footer
+BOILERPLATE_MIN_CHARS = 20  # shorter lines (titles, page numbers) are left alone
+PREPARED_CACHE_SIZE = 128  # files
+PREPARED_CACHE_TTL = 3600  # seconds
+
+
+class PreparedDocument:
+    """
+    One file to upload: the name it is uploaded under, the name citations show, and its bytes.
+    """
+    __slots__ = ("upload_name", "display_name", "data")
+
+    def __init__(self, upload_name, display_name, data):
+        self.upload_name = upload_name
+        self.display_name = display_name
+        self.data = data
+
+
+class PreprocessReport:
+    """
+    What preprocessing did to one batch.
+    """
+    def __init__(self):
+        self.original_bytes = 0
+        self.uploaded_bytes = 0
+        self.dropped_pages = 0
+        self.dropped_lines = 0
+        self.split_files = 0
+
+    @property
+    def bytes_saved(self):
+        return self.original_bytes - self.uploaded_bytes
+
+    def add(self, other):
+        self.original_bytes += other.original_bytes
+        self.uploaded_bytes += other.uploaded_bytes
+        self.dropped_pages += other.dropped_pages
+        self.dropped_lines += other.dropped_lines
+        self.split_files += other.split_files
+
+
+def _normalize(text):
+    lines = (" ".join(line.split()) for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def extract_pages(name, data):
+    """
+    Normalized text of each page (PDF) or section of a document, or None when the
+    format is not handled or yields no text (e.g. a scanned PDF). Runs in a worker process;
+    pypdf and python-docx are imported only when such a file is processed.
+    """
+    ext = os.path.splitext(name)[1].lower()
+    try:
+        if ext == ".pdf":
+            from pypdf import PdfReader
+            pages = [page.extract_text() or "" for page in PdfReader(io.BytesIO(data)).pages]
+        elif ext == ".docx":
+            import docx
+            pages = ["\n".join(p.text for p in docx.Document(io.BytesIO(data)).paragraphs)]
+        elif ext == ".csv":
+            pages = [_compact_csv(data.decode("utf-8-sig", errors="replace"))]
+        elif ext in (".txt", ".md"):
+            pages = [data.decode("utf-8", errors="replace")]
+        else:
+            return None
+    except ImportError:
+        return None
+    except Exception:
+        return None  # unreadable here; the backend may still parse the original
+    pages = [_normalize(page) for page in pages]
+    return pages if any(pages) else None
+
+
+def _compact_csv(text):
+    """
+    Drop empty columns, empty rows and repeated rows; trim every cell.
+    """
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096])
+    except csv.Error:
+        dialect = csv.excel
+    rows = [[cell.strip() for cell in row] for row in csv.reader(io.StringIO(text), dialect)]
+    width = max((len(row) for row in rows), default=0)
+    rows = [row + [""] * (width - len(row)) for row in rows]
+    keep = [i for i in range(width) if any(row[i] for row in rows)]
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    seen = set()
+    for row in rows:
+        row = tuple(row[i] for i in keep)
+        if any(row) and row not in seen:
+            seen.add(row)
+            writer.writerow(row)
+    return out.getvalue()
+
+
+@functools.lru_cache(maxsize=None)
+def _pool():
+    # spawn: forking a process that runs Streamlit's threads is not safe
+    return ProcessPoolExecutor(
+        max_workers=PREPROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _prepared_cache():
+    # Streamlit re-submits the same uploads on every rerun
+    return TTLCache(maxsize=PREPARED_CACHE_SIZE, ttl=PREPARED_CACHE_TTL)
+
+
+def _extract_all(files):
+    if not files:
+        return []
+    with metrics.span("document_extract", api=False):
+        try:
+            return list(_pool().map(extract_pages, *zip(*files)))
+        except BrokenProcessPool:
+            _pool.cache_clear()
+            return [extract_pages(name, data) for name, data in files]
+
+
+def _split(text, max_chars):
+    """
+    Cut `text` into parts of at most `max_chars`, preferring page and line boundaries.
+    """
+    parts = []
+    while len(text) > max_chars:
+        cut = text.rfind("\n\n", 0, max_chars)
+        if cut <= 0:
+            cut = text.rfind("\n", 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    parts.append(text)
+    return parts
+
+
+def _compact_pages(pages, report):
+    """
+    Join one document's pages, dropping repeated pages and all but the first
+    occurrence of its running headers and footers. Body lines are never dropped,
+    and pages too short to have a separate header and footer are left whole.
+    """
+    edge = BOILERPLATE_EDGE_LINES
+    page_lines = [page.splitlines() for page in pages]
+    edge_pages = Counter()
+    for lines in page_lines:
+        if len(lines) > 2 * edge:
+            edge_pages.update(set(lines[:edge] + lines[-edge:]))
+    boilerplate = {
+        line for line, n in edge_pages.items()
+        if n >= BOILERPLATE_MIN_PAGES and len(line) >= BOILERPLATE_MIN_CHARS
+    }
+    seen_pages, seen_boilerplate = set(), set()
+    kept = []
+    for page, lines in zip(pages, page_lines):
+        digest = hashlib.sha256(page.encode("utf-8")).digest()
+        if not page or digest in seen_pages:
+            report.dropped_pages += bool(page)
+            continue
+        seen_pages.add(digest)
+        out = []
+        for i, line in enumerate(lines):
+            at_edge = len(lines) > 2 * edge and (i < edge or i >= len(lines) - edge)
+            if at_edge and line in boilerplate:
+                if line in seen_boilerplate:
+                    report.dropped_lines += 1
+                    continue
+                seen_boilerplate.add(line)
+            out.append(line)
+        kept.append("\n".join(out))
+    return "\n\n".join(kept)
+
+
+def _prepare(name, data, pages, max_chars):
+    """
+    PreparedDocuments for one file and a PreprocessReport of that file alone.
+    The original is kept when its text would not be smaller.
+    """
+    report = PreprocessReport()
+    report.original_bytes = len(data)
+    text = _compact_pages(pages, report) if pages else ""
+    if not text or len(text.encode("utf-8")) >= len(data):
+        # Nothing gained (e.g. a clean text file, or a compressed PDF whose text is larger)
+        report.uploaded_bytes = len(data)
+        report.dropped_pages = report.dropped_lines = 0
+        return (PreparedDocument(name, name, data),), report
+    parts = _split(text, max_chars)
+    if len(parts) > 1:
+        report.split_files = 1
+    base, ext = os.path.splitext(name)
+    documents = []
+    for n, part in enumerate(parts, start=1):
+        suffix = f".part{n}" if len(parts) > 1 else ""
+        upload_name = f"{base}{suffix}{ext}" if ext.lower() in (".txt", ".md") else f"{name}{suffix}.txt"
+        body = part.encode("utf-8")
+        documents.append(PreparedDocument(upload_name, name, body))
+        report.uploaded_bytes += len(body)
+    return tuple(documents), report
+
+
+def preprocess_documents(files, max_chars=PREPROCESS_MAX_CHARS):
+    """
+    Turn (filename, bytes) pairs into PreparedDocuments and a PreprocessReport.
+    Each file's output depends only on that file, and is cached by its SHA-256,
+    so a rerun with the same uploads only hashes them.
+    """
+    cache = _prepared_cache()
+    keys = [(hashlib.sha256(data).hexdigest(), name, max_chars) for name, data in files]
+    results = {key: cache.get(key) for key in keys}
+    missing = {key: item for key, item in zip(keys, files) if results[key] is None}
+    handled = [key for key, (name, _) in missing.items() if name.lower().endswith(PREPROCESS_EXTENSIONS)]
+    extracted = dict(zip(handled, _extract_all([missing[key] for key in handled])))
+    for key, (name, data) in missing.items():
+        results[key] = _prepare(name, data, extracted.get(key), max_chars)
+        cache.put(key, results[key])
+        # Counted once per new document, not on every rerun
+        metrics.inc("preprocess_bytes_saved_total", results[key][1].bytes_saved)
+
+    report = PreprocessReport()
+    documents = []
+    for key in keys:
+        prepared, file_report = results[key]
+        documents.extend(prepared)
+        report.add(file_report)
+    return documents, report
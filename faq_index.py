@@ -0,0 +1,254 @@
+"""
+Local FAQ index
+---------------
+An offline-built lexical index of the knowledge documents, so plain lookups the
+documents answer verbatim skip the file_search run. Documents are split into
+overlapping chunks and scored with BM25. Postings are stored term-major as
+CSR-style NumPy arrays (term pointer, chunk ids, precomputed BM25 weights) and
+memory-mapped on load, so opening the index costs next to nothing and a query
+is one scatter-add per query term. Only confident matches are answered here;
+everything else falls through to the assistant.
+
+    python faq_index.py build docs/ --out faq_index
+    python faq_index.py query "qual é a franquia do seguro automóvel" --index faq_index
+"""
+
+import os
+import sys
+import json
+import math
+import argparse
+from collections import Counter
+import numpy as np
+from answer_cache import normalize_question
+
+FAQ_CHUNK_CHARS = 800
+FAQ_CHUNK_OVERLAP = 150
+BM25_K1 = 1.2
+BM25_B = 0.75
+FAQ_MIN_TERMS = 3  # shorter questions usually depend on the conversation
+FAQ_MIN_SCORE = 6.0  # minimum BM25 score of the best chunk
+FAQ_MIN_COVERAGE = 0.8  # share of the query terms the best chunk must contain
+FAQ_MIN_MARGIN = 1.25  # best score over the runner-up from another passage
+FAQ_MAX_PASSAGES = 2
+DOCUMENT_EXTENSIONS = (".txt", ".md", ".csv", ".pdf", ".docx")
+STOPWORDS = frozenset(
+    "a o as os um uma uns umas de do da dos das em no na nos nas por para com sem e ou que se "
+    "ao aos como qual quais quando onde mais menos meu minha seu sua ser e esta este isso isto "
+    "the an of to in on for with and or is are be it this that what which how when where do does"
+    .split()
+)
+
+
+def tokenize(text):
+    """
+    Normalized words without accents, punctuation or stopwords.
+    """
+    return [w for w in normalize_question(text).split() if len(w) > 1 and w not in STOPWORDS]
+
+
+def read_document(path):
+    """
+    Plain text of a knowledge document. PDF and DOCX need pypdf / python-docx;
+    they are imported only when such a file is indexed.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".pdf":
+        from pypdf import PdfReader
+        return "\n\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+    if ext == ".docx":
+        import docx
+        return "\n\n".join(p.text for p in docx.Document(path).paragraphs)
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def chunk_text(text, size=FAQ_CHUNK_CHARS, overlap=FAQ_CHUNK_OVERLAP):
+    """
+    Pack paragraphs into chunks of about `size` characters; overly long paragraphs
+    are cut with some overlap so a sentence on the boundary stays whole in one chunk.
+    """
+    pieces = []
+    for paragraph in text.split("\n\n"):
+        paragraph = " ".join(paragraph.split())
+        while len(paragraph) > size:
+            cut = paragraph.rfind(". ", overlap, size)
+            cut = cut + 1 if cut > 0 else size
+            pieces.append(paragraph[:cut])
+            paragraph = paragraph[max(cut - overlap, 1):].lstrip()
+        if paragraph:
+            pieces.append(paragraph)
+    chunks, current = [], ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 1 > size:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def build_index(paths, out_dir, k1=BM25_K1, b=BM25_B):
+    """
+    Index the given documents (directories are walked) into `out_dir`.
+    Returns the number of chunks indexed.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _dirs, names in os.walk(path):
+                files += [os.path.join(root, n) for n in sorted(names) if n.lower().endswith(DOCUMENT_EXTENSIONS)]
+        else:
+            files.append(path)
+    documents, texts, chunk_doc, chunk_terms = [], [], [], []
+    for path in files:
+        doc_id = len(documents)
+        documents.append(os.path.basename(path))
+        for chunk in chunk_text(read_document(path)):
+            terms = Counter(tokenize(chunk))
+            if terms:
+                texts.append(chunk)
+                chunk_doc.append(doc_id)
+                chunk_terms.append(terms)
+    n_chunks = len(texts)
+    lengths = np.array([sum(t.values()) for t in chunk_terms], dtype=np.float32)
+    avg_length = float(lengths.mean()) if n_chunks else 1.0
+    vocabulary = sorted({term for terms in chunk_terms for term in terms})
+    term_ids = {term: i for i, term in enumerate(vocabulary)}
+    postings = [[] for _ in vocabulary]  # term -> [(chunk, tf)], chunk ids ascending
+    for chunk_id, terms in enumerate(chunk_terms):
+        for term, tf in terms.items():
+            postings[term_ids[term]].append((chunk_id, tf))
+    term_ptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    chunk_ids = np.empty(sum(len(p) for p in postings), dtype=np.int32)
+    weights = np.empty(chunk_ids.size, dtype=np.float32)
+    pos = 0
+    for term_id, plist in enumerate(postings):
+        idf = math.log(1 + (n_chunks - len(plist) + 0.5) / (len(plist) + 0.5))
+        for chunk_id, tf in plist:
+            norm = k1 * (1 - b + b * lengths[chunk_id] / avg_length)
+            chunk_ids[pos] = chunk_id
+            weights[pos] = idf * tf * (k1 + 1) / (tf + norm)
+            pos += 1
+        term_ptr[term_id + 1] = pos
+
+    os.makedirs(out_dir, exist_ok=True)
+    encoded = [t.encode("utf-8") for t in texts]
+    text_ptr = np.zeros(n_chunks + 1, dtype=np.int64)
+    text_ptr[1:] = np.cumsum([len(t) for t in encoded])
+    with open(os.path.join(out_dir, "chunks.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+    np.save(os.path.join(out_dir, "text_ptr.npy"), text_ptr)
+    np.save(os.path.join(out_dir, "chunk_doc.npy"), np.array(chunk_doc, dtype=np.int32))
+    np.save(os.path.join(out_dir, "term_ptr.npy"), term_ptr)
+    np.save(os.path.join(out_dir, "chunk_ids.npy"), chunk_ids)
+    np.save(os.path.join(out_dir, "weights.npy"), weights)
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"documents": documents, "vocabulary": vocabulary}, f, ensure_ascii=False)
+    return n_chunks
+
+
+class FAQIndex:
+    """
+    Read-only, memory-mapped BM25 index built by `build_index`.
+    """
+    def __init__(self, path, min_terms=FAQ_MIN_TERMS, min_score=FAQ_MIN_SCORE,
+                 min_coverage=FAQ_MIN_COVERAGE, min_margin=FAQ_MIN_MARGIN):
+        self.min_terms = min_terms
+        self.min_score = min_score
+        self.min_coverage = min_coverage
+        self.min_margin = min_margin
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.documents = meta["documents"]
+        self.term_ids = {term: i for i, term in enumerate(meta["vocabulary"])}
+        load = lambda name: np.load(os.path.join(path, name), mmap_mode="r")
+        self.text_ptr = load("text_ptr.npy")
+        self.chunk_doc = load("chunk_doc.npy")
+        self.term_ptr = load("term_ptr.npy")
+        self.chunk_ids = load("chunk_ids.npy")
+        self.weights = load("weights.npy")
+        self.texts = np.memmap(os.path.join(path, "chunks.bin"), dtype=np.uint8, mode="r") \
+            if self.text_ptr[-1] else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.chunk_doc)
+
+    def chunk(self, chunk_id):
+        start, end = self.text_ptr[chunk_id], self.text_ptr[chunk_id + 1]
+        return self.texts[start:end].tobytes().decode("utf-8")
+
+    def search(self, query, k=3):
+        """
+        Best `k` chunks as (score, chunk id, share of query terms the chunk contains).
+        """
+        query_terms = dict.fromkeys(tokenize(query))
+        terms = [self.term_ids[t] for t in query_terms if t in self.term_ids]
+        if not terms or not len(self):
+            return []
+        scores = np.zeros(len(self), dtype=np.float32)
+        hits = np.zeros(len(self), dtype=np.int32)
+        for term_id in terms:
+            start, end = self.term_ptr[term_id], self.term_ptr[term_id + 1]
+            ids = self.chunk_ids[start:end]
+            scores[ids] += self.weights[start:end]
+            hits[ids] += 1
+        k = min(k, len(self))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), int(i), hits[i] / len(query_terms)) for i in top if scores[i] > 0]
+
+    def lookup(self, query):
+        """
+        (reply, sources) built from the matching passages, in the `[n]` format of
+        `send_and_get_response`, or None when the match is not confident enough.
+        """
+        if len(tokenize(query)) < self.min_terms:
+            return None
+        results = self.search(query, k=FAQ_MAX_PASSAGES + 1)
+        if not results:
+            return None
+        best_score, _best_id, coverage = results[0]
+        runner_up = results[1][0] if len(results) > 1 else 0.0
+        if best_score < self.min_score or coverage < self.min_coverage:
+            return None
+        if runner_up and best_score / runner_up < self.min_margin and coverage < 1.0:
+            return None
+        passages, sources, numbers = [], [], {}
+        for score, chunk_id, _coverage in results[:FAQ_MAX_PASSAGES]:
+            if passages and score < best_score / self.min_margin:
+                break  # only add passages about as relevant as the best one
+            file = self.documents[self.chunk_doc[chunk_id]]
+            if file not in numbers:
+                numbers[file] = len(numbers) + 1
+                sources.append({"n": numbers[file], "file": file})
+            passages.append(f"{self.chunk(chunk_id)} [{numbers[file]}]")
+        return "\n\n".join(passages), sources
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the local FAQ index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="index documents (files or directories)")
+    build.add_argument("paths", nargs="+")
+    build.add_argument("--out", default="faq_index")
+    query = commands.add_parser("query", help="show the best passages for a question")
+    query.add_argument("question")
+    query.add_argument("--index", default="faq_index")
+    query.add_argument("-k", type=int, default=3)
+    args = parser.parse_args()
+    if args.command == "build":
+        print(f"indexed {build_index(args.paths, args.out)} chunks into {args.out}", file=sys.stderr)
+        return
+    index = FAQIndex(args.index)
+    for score, chunk_id, coverage in index.search(args.question, args.k):
+        print(f"{score:7.2f}  {coverage:4.0%}  {index.documents[index.chunk_doc[chunk_id]]}")
+        print(f"         {index.chunk(chunk_id)[:200]}")
+    hit = index.lookup(args.question)
+    print("\nanswered locally" if hit else "\nfalls through to the assistant")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Content-addressed index of uploaded files
+-----------------------------------------
+Maps the SHA-256 of a file's bytes to the OpenAI file id it was uploaded as,
+so identical documents are never uploaded twice. The index is persisted as JSON
+next to the app, like the assistant id in AssistantID.TXT. Every change is
+applied to a fresh read of the file under a file lock, so several app
+processes sharing it do not overwrite each other's entries.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from assistant_registry import file_lock
+import metrics
+
+UPLOAD_WORKERS = 4
+
+
+def sha256_bytes(data: bytes) -> str:
+    """
+    Return the hex SHA-256 digest of `data`.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+class FileIndex:
+    """
+    Persistent SHA-256 -> file_id index with a bounded parallel upload helper.
+    Safe to share between Streamlit sessions (all access goes through a lock).
+    """
+    def __init__(self, path, max_workers=UPLOAD_WORKERS):
+        self.path = path
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._entries = self._read() or {}
+
+    def get(self, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+        return entry["file_id"] if entry else None
+
+    def filename(self, file_id):
+        """
+        Return the original filename recorded for `file_id`, if known.
+        """
+        with self._lock:
+            for entry in self._entries.values():
+                if entry["file_id"] == file_id:
+                    return entry["filename"]
+        return None
+
+    def put(self, digest, file_id, filename):
+        def add(entries):
+            entries[digest] = {"file_id": file_id, "filename": filename}
+        self._update(add)
+
+    def forget(self, file_id):
+        """
+        Drop every entry pointing at `file_id` (e.g. after it was deleted remotely).
+        """
+        def drop(entries):
+            for digest in [d for d, e in entries.items() if e["file_id"] == file_id]:
+                del entries[digest]
+        self._update(drop)
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _update(self, change):
+        """
+        Apply `change` to the entries on disk (other processes may have added some),
+        save them and adopt them as this process's view.
+        """
+        with self._lock, file_lock(f"{self.path}.lock"):
+            entries = self._read()
+            if entries is None:
+                entries = dict(self._entries)
+            change(entries)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+            self._entries = entries
+
+    def upload_all(self, client, files, purpose="assistants", on_upload=None, display_names=None):
+        """
+        Return a (digest, file_id) pair for each (filename, bytes) in `files`, in order.
+        Unknown content is uploaded straight from memory on a bounded thread pool;
+        `on_upload(file_id, filename)` is called for every new upload. `display_names`
+        records a different name for citations (e.g. the original of a preprocessed file).
+        """
+        digests = [sha256_bytes(data) for _, data in files]
+        display_names = display_names or [name for name, _ in files]
+        pending = {}
+        for digest, (name, data), display_name in zip(digests, files, display_names):
+            known = self.get(digest) is not None
+            metrics.cache_result("file_index", known)
+            if not known and digest not in pending:
+                pending[digest] = (name, data, display_name)
+
+        def upload(item):
+            digest, (name, data, display_name) = item
+            with metrics.span("file_upload"):
+                uploaded = client.files.create(file=(name, data), purpose=purpose)
+            self.put(digest, uploaded.id, display_name)
+            if on_upload:
+                on_upload(uploaded.id, display_name)
+            return uploaded.id
+
+        if pending:
+            workers = max(1, min(self.max_workers, len(pending)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(upload, pending.items()))
+        return [(digest, self.get(digest)) for digest in digests]
@@ -0,0 +1,86 @@
+"""
+Citation file-name resolution
+-----------------------------
+Caches file_id -> filename for citation/source display. Names of files uploaded
+by this process are seeded directly, names known locally (e.g. from the file
+index) come from `fallback`; other misses are fetched concurrently, and a file
+being fetched is never requested a second time while that lookup is in flight.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from ttl_cache import TTLCache
+import metrics
+
+FILE_NAME_CACHE_SIZE = 2048
+FILE_NAME_CACHE_TTL = 24 * 3600  # seconds
+FILE_NAME_WORKERS = 8
+
+
+class FileNameResolver:
+    """
+    LRU+TTL cache of file names in front of `client.files.retrieve`.
+    """
+    def __init__(self, client, maxsize=FILE_NAME_CACHE_SIZE, ttl=FILE_NAME_CACHE_TTL,
+                 max_workers=FILE_NAME_WORKERS, fallback=None):
+        self.client = client
+        self.fallback = fallback  # file_id -> known filename or None, checked before the API
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="file-names")
+
+    def seed(self, file_id, file_name):
+        self.cache.put(file_id, file_name)
+
+    def prefetch(self, file_ids):
+        """
+        Start fetching the names that are neither cached nor already in flight.
+        Returns the futures for those still being fetched.
+        """
+        futures = {}
+        with self._lock:
+            for file_id in file_ids:
+                if file_id in futures:
+                    continue
+                cached = file_id in self.cache
+                metrics.cache_result("file_names", cached)
+                if cached:
+                    continue
+                future = self._in_flight.get(file_id)
+                if future is None:
+                    future = self._pool.submit(self._fetch, file_id)
+                    self._in_flight[file_id] = future
+                futures[file_id] = future
+        return futures
+
+    def resolve(self, file_ids):
+        """
+        Return {file_id: filename}, fetching all misses in one concurrent batch.
+        Lookups that fail fall back to the file id and are not cached.
+        """
+        futures = self.prefetch(file_ids)
+        names = {}
+        for file_id in file_ids:
+            if file_id in futures:
+                names[file_id] = futures[file_id].result()
+            else:
+                names[file_id] = self.cache.get(file_id, file_id)
+        return names
+
+    def _fetch(self, file_id):
+        try:
+            file_name = self.fallback(file_id) if self.fallback else None
+            if file_name:
+                self.cache.put(file_id, file_name)
+                return file_name
+            with metrics.span("file_retrieve"):
+                file_obj = self.client.files.retrieve(file_id)
+            file_name = getattr(file_obj, "filename", None) or getattr(file_obj, "name", None) or str(file_obj)
+            self.cache.put(file_id, file_name)
+            return file_name
+        except Exception:
+            return file_id
+        finally:
+            with self._lock:
+                self._in_flight.pop(file_id, None)
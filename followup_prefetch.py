@@ -0,0 +1,125 @@
+"""
+Speculative follow-up prefetch
+------------------------------
+After a reply, the agent's next question is often predictable ("and for the
+premium tier?", "how do I explain this to the client by email?"). The
+prefetcher asks the model for a few likely follow-ups and answers them in the
+background, each on a side thread seeded with the last exchange, so the real
+thread is never touched. Answers land in a short-lived semantic cache scoped to
+the conversation and are served if the agent asks a matching question.
+
+Speculation is strictly bounded: a process-wide cap on concurrent speculative
+runs (work over the cap is skipped, not queued), prompt- and completion-token
+caps per run, and an hourly token budget shared by all sessions that is
+charged the worst case of both before anything is sent. The runs themselves go
+through the shared run scheduler as background work, behind agents' runs.
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from answer_cache import AnswerCache
+from context_window import estimate_tokens
+import metrics
+
+PREFETCH_FOLLOWUPS = 3  # follow-ups predicted per reply
+PREFETCH_MAX_CONCURRENT = 2  # speculative runs in flight, process-wide
+PREFETCH_MAX_TOKENS = 400  # completion tokens per speculative answer
+PREFETCH_MAX_PROMPT_TOKENS = 8000  # prompt tokens per speculative run (seeded thread + file_search chunks)
+PREFETCH_SUGGEST_TOKENS = 120  # completion tokens for predicting the follow-ups
+PREFETCH_TOKEN_BUDGET = 100000  # prompt + completion tokens per hour across all sessions
+PREFETCH_TTL = 300  # seconds a speculative answer stays servable
+# Predicted and typed questions rarely match word for word, but the cache also
+# requires the same content words, so "email"/"telefone" or "Base"/"Premium" never match
+PREFETCH_MATCH_THRESHOLD = 0.8
+
+
+class TokenBudget:
+    """
+    Hourly token allowance that refills continuously; spending never goes negative.
+    """
+    def __init__(self, tokens_per_hour):
+        self.capacity = tokens_per_hour
+        self.rate = tokens_per_hour / 3600.0
+        self.tokens = float(tokens_per_hour)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_spend(self, tokens):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < tokens:
+                return False
+            self.tokens -= tokens
+            return True
+
+
+class FollowupPrefetcher:
+    """
+    Predicts and pre-answers follow-up questions.
+    `suggest(question, reply, n, max_tokens)` returns likely follow-up questions;
+    `answer(context, followup, max_tokens, max_prompt_tokens)` returns (reply, sources)
+    or None, where `context` is whatever `schedule` was given to seed the side thread.
+    """
+    def __init__(self, suggest, answer, followups=PREFETCH_FOLLOWUPS,
+                 max_concurrent=PREFETCH_MAX_CONCURRENT, max_tokens=PREFETCH_MAX_TOKENS,
+                 max_prompt_tokens=PREFETCH_MAX_PROMPT_TOKENS, suggest_tokens=PREFETCH_SUGGEST_TOKENS,
+                 budget=PREFETCH_TOKEN_BUDGET, ttl=PREFETCH_TTL, threshold=PREFETCH_MATCH_THRESHOLD):
+        self.suggest = suggest
+        self.answer = answer
+        self.followups = followups
+        self.max_tokens = max_tokens
+        self.max_prompt_tokens = max_prompt_tokens
+        self.suggest_tokens = suggest_tokens
+        self.budget = TokenBudget(budget)
+        self.cache = AnswerCache(maxsize=256, ttl=ttl, threshold=threshold, min_words=1)
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrent + 1, thread_name_prefix="prefetch")
+
+    def schedule(self, conversation, question, reply, context):
+        """
+        Start predicting and answering follow-ups of this exchange in the background.
+        `conversation` scopes the cached answers (e.g. the thread id).
+        """
+        # The suggestion prompt is the exchange itself
+        if not self.budget.try_spend(self.suggest_tokens + estimate_tokens(question + reply)):
+            metrics.inc("prefetch_skipped_total", reason="budget")
+            return None
+        return self._pool.submit(self._run, conversation, question, reply, context)
+
+    def get(self, conversation, question):
+        """
+        A speculative (reply, sources) matching the question, or None.
+        """
+        hit = self.cache.get(conversation, question)
+        metrics.cache_result("prefetch", hit is not None)
+        return hit
+
+    def _run(self, conversation, question, reply, context):
+        try:
+            with metrics.span("prefetch_suggest"):
+                followups = self.suggest(question, reply, self.followups, self.suggest_tokens)
+        except Exception:
+            return
+        for followup in followups[: self.followups]:
+            if not self._slots.acquire(blocking=False):
+                metrics.inc("prefetch_skipped_total", reason="concurrency")
+                continue
+            if not self.budget.try_spend(self.max_prompt_tokens + self.max_tokens):
+                self._slots.release()
+                metrics.inc("prefetch_skipped_total", reason="budget")
+                break
+            self._pool.submit(self._answer, conversation, followup, context)
+
+    def _answer(self, conversation, followup, context):
+        try:
+            with metrics.span("prefetch_answer", api=False):
+                result = self.answer(context, followup, self.max_tokens, self.max_prompt_tokens)
+            if result is not None:
+                self.cache.put(conversation, followup, *result)
+        except Exception:
+            pass  # speculation is best effort
+        finally:
+            self._slots.release()
@@ -0,0 +1,243 @@
+"""
+Latency instrumentation
+-----------------------
+A small, dependency-free metrics registry: labelled counters and histograms,
+plus a `span` timer for pipeline stages. Metrics can be scraped in Prometheus
+text format from a side HTTP endpoint, or flushed periodically as JSON lines.
+All modules record into the process-wide REGISTRY.
+"""
+
+import json
+import time
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+FLUSH_INTERVAL = 30  # seconds
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{name}="{str(value).replace(chr(34), chr(39))}"' for name, value in pairs)
+    return "{" + body + "}"
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram for one label set.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def quantile(self, q):
+        """
+        Bucket-resolution estimate (upper bound of the bucket holding the q-th value).
+        """
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class MetricsRegistry:
+    """
+    Thread-safe store of counters and histograms keyed by name and labels.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}  # name -> {label_key: value}
+        self._histograms = {}  # name -> {label_key: Histogram}
+        self._help = {}
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, amount=1, **labels):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            key = _label_key(labels)
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    @contextmanager
+    def span(self, stage, api=True):
+        """
+        Time a pipeline stage into `stage_duration_seconds{stage}`. API stages also
+        count into `api_calls_total`, and failures into `stage_errors_total`.
+        Script-control exits (Streamlit's rerun/stop, KeyboardInterrupt) are neither
+        errors nor complete stages, so they record nothing.
+        """
+        start = time.perf_counter()
+        if api:
+            self.inc("api_calls_total", stage=stage)
+        try:
+            yield
+        except Exception as exc:
+            self.inc("stage_errors_total", stage=stage, error=type(exc).__name__)
+            self.observe("stage_duration_seconds", time.perf_counter() - start, stage=stage)
+            raise
+        else:
+            self.observe("stage_duration_seconds", time.perf_counter() - start, stage=stage)
+
+    def render_prometheus(self):
+        """
+        Prometheus text exposition format (version 0.0.4).
+        """
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, hist in series.items():
+                    cumulative = 0
+                    for bound, n in zip(hist.buckets + (float("inf"),), hist.counts):
+                        cumulative += n
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', le)])} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {hist.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """
+        JSON-friendly view with p50/p95/p99 estimates per histogram series.
+        """
+        with self._lock:
+            return {
+                "ts": time.time(),
+                "counters": {
+                    name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                    for name, series in self._counters.items()
+                },
+                "histograms": {
+                    name: [
+                        {
+                            "labels": dict(key),
+                            "count": hist.count,
+                            "sum": hist.sum,
+                            "p50": hist.quantile(0.5),
+                            "p95": hist.quantile(0.95),
+                            "p99": hist.quantile(0.99),
+                        }
+                        for key, hist in series.items()
+                    ]
+                    for name, series in self._histograms.items()
+                },
+            }
+
+
+REGISTRY = MetricsRegistry()
+REGISTRY.describe("api_calls_total", "API calls made, by pipeline stage.")
+REGISTRY.describe("stage_errors_total", "Stages that raised, by stage and exception type.")
+REGISTRY.describe("stage_duration_seconds", "Wall time per pipeline stage.")
+REGISTRY.describe("run_status_seconds", "Time an assistant run spent in each status.")
+REGISTRY.describe("cache_requests_total", "Cache lookups, by cache and result (hit/miss).")
+REGISTRY.describe("retries_total", "Retried requests, by stage.")
+REGISTRY.describe("timeouts_total", "Requests that hit their timeout, by stage.")
+REGISTRY.describe("time_to_first_token_seconds", "Time from starting a run to its first reply text.")
+
+
+class StatusTimer:
+    """
+    Records how long something stayed in each status, e.g. a run going
+    queued -> in_progress -> completed, into `run_status_seconds{status}`.
+    """
+    def __init__(self, name="run_status_seconds", registry=REGISTRY):
+        self.name = name
+        self.registry = registry
+        self.status = None
+        self.since = time.perf_counter()
+
+    def transition(self, status):
+        if status == self.status:
+            return
+        now = time.perf_counter()
+        if self.status is not None:
+            self.registry.observe(self.name, now - self.since, status=self.status)
+        self.status, self.since = status, now
+
+
+span = REGISTRY.span
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+
+
+def cache_result(cache, hit):
+    REGISTRY.inc("cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+
+def start_http_server(port, host="0.0.0.0", registry=REGISTRY):
+    """
+    Serve `GET /metrics` in Prometheus format from a daemon thread.
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def start_jsonl_flusher(path, interval=FLUSH_INTERVAL, registry=REGISTRY):
+    """
+    Append a registry snapshot to `path` every `interval` seconds from a daemon thread.
+    """
+    stop = threading.Event()
+
+    def flush_loop():
+        while not stop.wait(interval):
+            with open(path, "a") as f:
+                f.write(json.dumps(registry.snapshot()) + "\n")
+
+    threading.Thread(target=flush_loop, name="metrics-flush", daemon=True).start()
+    return stop
@@ -0,0 +1,549 @@
+"""
+Local mock backend
+------------------
+A stand-in for the Azure OpenAI / OpenAI endpoints the app uses, for load tests
+that must not burn quota: assistants, threads, messages, runs (polled and
+streamed), files, vector stores, chat completions and Whisper transcriptions.
+Latency is log-normal per request, replies stream at a configurable token rate,
+and a share of requests can fail with 500 or be rate limited with 429.
+
+Run standalone:  python mock_backend.py --port 8600 --rate-limit-rate 0.02
+Then point the app at it with AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8600 and
+WHISPER_BASE_URL=http://127.0.0.1:8600/v1 (any API key works).
+"""
+
+import re
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockConfig:
+    """
+    Latency, failure and throughput knobs of the mock backend.
+    """
+    def __init__(self, latency_ms=40.0, latency_sigma=0.4, failure_rate=0.0, rate_limit_rate=0.0,
+                 retry_after=1.0, queue_ms=200.0, tokens_per_second=80.0, reply_tokens=60,
+                 whisper_ms=400.0, seed=None):
+        self.latency_ms = latency_ms  # median per-request latency
+        self.latency_sigma = latency_sigma  # log-normal spread
+        self.failure_rate = failure_rate  # share of requests answered with 500
+        self.rate_limit_rate = rate_limit_rate  # share of requests answered with 429
+        self.retry_after = retry_after  # seconds, sent with every 429
+        self.queue_ms = queue_ms  # time a run spends queued before generating
+        self.tokens_per_second = tokens_per_second  # streaming speed of replies
+        self.reply_tokens = reply_tokens  # words per generated reply
+        self.whisper_ms = whisper_ms  # median transcription time
+        self.random = random.Random(seed)
+
+    def latency(self, median_ms=None):
+        median = (self.latency_ms if median_ms is None else median_ms) / 1000.0
+        return median * self.random.lognormvariate(0.0, self.latency_sigma)
+
+
+def _now():
+    return int(time.time())
+
+
+def _new_id(prefix):
+    return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+
+class MockState:
+    """
+    In-memory objects of the fake API. All access goes through one lock.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.threads = {}  # id -> {"messages": [...], "vector_store_ids": [...]}
+        self.runs = {}  # id -> run dict (plus private timing fields)
+        self.files = {}
+        self.vector_stores = {}
+        self.batches = {}
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0}
+
+    def thread(self, thread_id):
+        return self.threads.setdefault(thread_id, {"messages": [], "vector_store_ids": []})
+
+    def reply_for(self, thread_id):
+        """
+        Deterministic reply to the last user message, with a citation when documents are available.
+        """
+        thread = self.thread(thread_id)
+        question = next((m for m in reversed(thread["messages"]) if m["role"] == "user"), None)
+        text = question["content"][0]["text"]["value"] if question else ""
+        words = ["Resposta", "simulada", "para:"] + text.split()
+        filler = ["cobertura", "apólice", "cliente", "seguro", "prémio", "franquia"]
+        while len(words) < self.config.reply_tokens:
+            words.append(self.config.random.choice(filler))
+        file_ids = [a["file_id"] for m in thread["messages"] for a in (m.get("attachments") or [])]
+        for store_id in thread["vector_store_ids"]:
+            file_ids += self.vector_stores.get(store_id, {}).get("file_ids", [])
+        return words, (file_ids[0] if file_ids else None)
+
+
+def _message(thread_id, role, text, message_id=None, annotations=None, run_id=None, attachments=None):
+    return {
+        "id": message_id or _new_id("msg"),
+        "object": "thread.message",
+        "created_at": _now(),
+        "thread_id": thread_id,
+        "role": role,
+        "status": "completed",
+        "run_id": run_id,
+        "assistant_id": None,
+        "attachments": attachments or [],
+        "metadata": {},
+        "content": [{"type": "text", "text": {"value": text, "annotations": annotations or []}}],
+    }
+
+
+def _public_run(run):
+    return {k: v for k, v in run.items() if not k.startswith("_")}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None  # set by make_server
+
+    # --- plumbing ---
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _json_body(self, raw):
+        try:
+            return json.loads(raw or b"{}")
+        except ValueError:
+            return {}
+
+    def _send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message, code=None, headers=None):
+        self._send_json({"error": {"message": message, "type": "mock_error", "code": code}}, status, headers)
+
+    def _path(self):
+        # Accept Azure (/openai/...) and OpenAI (/v1/...) prefixes alike
+        path = self.path.split("?")[0]
+        return re.sub(r"^/(openai|v1)(?=/)", "", path)
+
+    def _inject_faults(self):
+        """
+        Sleep for the request latency, then maybe answer with 429 or 500 instead.
+        Returns True when a fault response was sent.
+        """
+        config = self.state.config
+        time.sleep(config.latency())
+        with self.state.lock:
+            self.state.stats["requests"] += 1
+            roll = config.random.random()
+        if roll < config.rate_limit_rate:
+            with self.state.lock:
+                self.state.stats["rate_limited"] += 1
+            self._error(429, "Rate limit is exceeded.", "rate_limit_exceeded",
+                        {"Retry-After": str(config.retry_after)})
+            return True
+        if roll < config.rate_limit_rate + config.failure_rate:
+            with self.state.lock:
+                self.state.stats["errors"] += 1
+            self._error(500, "Mock internal error.")
+            return True
+        return False
+
+    # --- routing ---
+
+    def do_GET(self):
+        self._dispatch("GET", b"")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE", b"")
+
+    def do_POST(self):
+        self._dispatch("POST", self._body())
+
+    def _dispatch(self, method, raw):
+        path = self._path()
+        if path == "/mock/stats":
+            with self.state.lock:
+                return self._send_json(dict(self.state.stats))
+        if self._inject_faults():
+            return
+        for pattern, route_method, handler in ROUTES:
+            match = re.fullmatch(pattern, path)
+            if match and route_method == method:
+                return handler(self, raw, *match.groups())
+        self._error(404, f"No mock route for {method} {path}")
+
+    # --- assistants & threads ---
+
+    def create_assistant(self, raw):
+        body = self._json_body(raw)
+        self._send_json({"id": _new_id("asst"), "object": "assistant", "created_at": _now(),
+                         "name": body.get("name"), "model": body.get("model"),
+                         "instructions": body.get("instructions"), "tools": body.get("tools", []),
+                         "metadata": body.get("metadata") or {}})
+
+    def get_assistant(self, raw, assistant_id):
+        # Any id is accepted, so an existing AssistantID.TXT works against the mock
+        self._send_json({"id": assistant_id, "object": "assistant", "created_at": _now(),
+                         "name": "mock", "model": "gpt-4o-mini", "instructions": "",
+                         "tools": [{"type": "file_search"}], "metadata": {}})
+
+    def update_assistant(self, raw, assistant_id):
+        body = self._json_body(raw)
+        self._send_json({"id": assistant_id, "object": "assistant", "created_at": _now(),
+                         "name": body.get("name"), "model": body.get("model"),
+                         "instructions": body.get("instructions"), "tools": body.get("tools", []),
+                         "metadata": body.get("metadata") or {}})
+
+    def create_thread(self, raw):
+        body = self._json_body(raw)
+        thread_id = _new_id("thread")
+        with self.state.lock:
+            thread = self.state.thread(thread_id)
+            for message in body.get("messages") or []:
+                thread["messages"].append(_message(thread_id, message["role"], message["content"]))
+            resources = (body.get("tool_resources") or {}).get("file_search") or {}
+            thread["vector_store_ids"] = resources.get("vector_store_ids", [])
+        self._send_json({"id": thread_id, "object": "thread", "created_at": _now(),
+                         "metadata": {}, "tool_resources": body.get("tool_resources") or {}})
+
+    def update_thread(self, raw, thread_id):
+        body = self._json_body(raw)
+        with self.state.lock:
+            resources = (body.get("tool_resources") or {}).get("file_search") or {}
+            self.state.thread(thread_id)["vector_store_ids"] = resources.get("vector_store_ids", [])
+        self._send_json({"id": thread_id, "object": "thread", "created_at": _now(),
+                         "metadata": {}, "tool_resources": body.get("tool_resources") or {}})
+
+    def delete_thread(self, raw, thread_id):
+        with self.state.lock:
+            self.state.threads.pop(thread_id, None)
+        self._send_json({"id": thread_id, "object": "thread.deleted", "deleted": True})
+
+    def create_message(self, raw, thread_id):
+        body = self._json_body(raw)
+        content = body.get("content")
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content)
+        with self.state.lock:
+            thread = self.state.thread(thread_id)
+            active = [r for r in self.state.runs.values()
+                      if r["thread_id"] == thread_id and self._run_status(r) in ("queued", "in_progress")]
+            if active:
+                return self._error(400, f"Thread {thread_id} already has an active run {active[0]['id']}.")
+            message = _message(thread_id, body.get("role", "user"), content, attachments=body.get("attachments"))
+            thread["messages"].append(message)
+        self._send_json(message)
+
+    def list_messages(self, raw, thread_id):
+        with self.state.lock:
+            data = list(reversed(self.state.thread(thread_id)["messages"]))
+        self._send_json({"object": "list", "data": data, "first_id": data[0]["id"] if data else None,
+                         "last_id": data[-1]["id"] if data else None, "has_more": False})
+
+    # --- runs ---
+
+    def _run_status(self, run):
+        if run["status"] in ("cancelled", "failed", "completed", "expired"):
+            return run["status"]
+        elapsed = time.time() - run["_started"]
+        if elapsed < run["_queue"]:
+            return "queued"
+        if elapsed < run["_queue"] + run["_generate"]:
+            return "in_progress"
+        self._complete_run(run)
+        return "completed"
+
+    def _complete_run(self, run):
+        if run["status"] == "completed":
+            return
+        run["status"] = "completed"
+        run["completed_at"] = _now()
+        words, file_id = run["_reply"]
+        annotations = []
+        text = " ".join(words)
+        if file_id:
+            marker = "【4:0†source】"
+            annotations.append({"type": "file_citation", "text": marker, "start_index": len(text) + 1,
+                                "end_index": len(text) + 1 + len(marker), "file_citation": {"file_id": file_id}})
+            text += " " + marker
+        self.state.thread(run["thread_id"])["messages"].append(
+            _message(run["thread_id"], "assistant", text, run["_message_id"], annotations, run["id"])
+        )
+
+    def create_run(self, raw, thread_id):
+        body = self._json_body(raw)
+        config = self.state.config
+        with self.state.lock:
+            words, file_id = self.state.reply_for(thread_id)
+            run = {
+                "id": _new_id("run"), "object": "thread.run", "created_at": _now(),
+                "thread_id": thread_id, "assistant_id": body.get("assistant_id"),
+                "status": "queued", "model": "gpt-4o-mini", "instructions": "", "tools": [],
+                "last_error": None, "completed_at": None, "cancelled_at": None,
+                "_started": time.time(), "_queue": config.latency(config.queue_ms),
+                "_generate": len(words) / config.tokens_per_second,
+                "_reply": (words, file_id), "_message_id": _new_id("msg"),
+            }
+            self.state.runs[run["id"]] = run
+        if body.get("stream"):
+            return self._stream_run(run)
+        self._send_json(_public_run(run))
+
+    def get_run(self, raw, thread_id, run_id):
+        with self.state.lock:
+            run = self.state.runs.get(run_id)
+            if run is None:
+                return self._error(404, f"No run {run_id}")
+            run["status"] = self._run_status(run)
+            payload = _public_run(run)
+        self._send_json(payload)
+
+    def cancel_run(self, raw, thread_id, run_id):
+        with self.state.lock:
+            run = self.state.runs.get(run_id)
+            if run is None:
+                return self._error(404, f"No run {run_id}")
+            if self._run_status(run) in ("queued", "in_progress"):
+                run["status"] = "cancelled"
+                run["cancelled_at"] = _now()
+            payload = _public_run(run)
+        self._send_json(payload)
+
+    def _sse(self, event, data):
+        chunk = f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+        self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+        self.wfile.flush()
+
+    def _stream_run(self, run):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        thread_id = run["thread_id"]
+        words, file_id = run["_reply"]
+        public = _public_run(run)
+        self._sse("thread.run.created", public)
+        self._sse("thread.run.queued", public)
+        time.sleep(run["_queue"])
+        if self._stream_cancelled(run):
+            return
+        self._sse("thread.run.in_progress", dict(public, status="in_progress"))
+        message = _message(thread_id, "assistant", "", run["_message_id"], run_id=run["id"])
+        message["content"] = []
+        message["status"] = "in_progress"
+        self._sse("thread.message.created", message)
+        delay = 1.0 / self.state.config.tokens_per_second
+        for i, word in enumerate(words):
+            time.sleep(delay)
+            if self._stream_cancelled(run):
+                return
+            value = word if i == 0 else " " + word
+            self._sse("thread.message.delta", {"id": message["id"], "object": "thread.message.delta",
+                                               "delta": {"content": [{"index": 0, "type": "text",
+                                                                      "text": {"value": value}}]}})
+        if file_id:
+            marker = "【4:0†source】"
+            self._sse("thread.message.delta", {"id": message["id"], "object": "thread.message.delta",
+                                               "delta": {"content": [{"index": 0, "type": "text", "text": {
+                                                   "value": " " + marker,
+                                                   "annotations": [{"index": 0, "type": "file_citation",
+                                                                    "text": marker,
+                                                                    "file_citation": {"file_id": file_id}}]}}]}})
+        with self.state.lock:
+            self._complete_run(run)
+            final = self.state.thread(thread_id)["messages"][-1]
+            public = _public_run(run)
+        self._sse("thread.message.completed", final)
+        self._sse("thread.run.completed", public)
+        self._end_stream()
+
+    def _stream_cancelled(self, run):
+        with self.state.lock:
+            cancelled = run["status"] == "cancelled"
+            public = _public_run(run)
+        if cancelled:
+            self._sse("thread.run.cancelled", public)
+            self._end_stream()
+        return cancelled
+
+    def _end_stream(self):
+        chunk = b"data: [DONE]\n\n"
+        self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n0\r\n\r\n")
+        self.wfile.flush()
+
+    # --- files & vector stores ---
+
+    def create_file(self, raw):
+        match = re.search(rb'filename="([^"]*)"', raw)
+        file_id = _new_id("file")
+        record = {"id": file_id, "object": "file", "bytes": len(raw), "created_at": _now(),
+                  "filename": match.group(1).decode("utf-8", "replace") if match else "upload",
+                  "purpose": "assistants", "status": "processed"}
+        with self.state.lock:
+            self.state.files[file_id] = record
+        self._send_json(record)
+
+    def get_file(self, raw, file_id):
+        with self.state.lock:
+            record = self.state.files.get(file_id)
+        if record is None:
+            return self._error(404, f"No file {file_id}")
+        self._send_json(record)
+
+    def create_vector_store(self, raw):
+        body = self._json_body(raw)
+        store = {"id": _new_id("vs"), "object": "vector_store", "created_at": _now(), "name": body.get("name"),
+                 "status": "completed", "usage_bytes": 0, "last_active_at": _now(), "metadata": {},
+                 "file_counts": {"in_progress": 0, "completed": 0, "failed": 0, "cancelled": 0, "total": 0},
+                 "file_ids": body.get("file_ids") or []}
+        with self.state.lock:
+            self.state.vector_stores[store["id"]] = store
+        self._send_json({k: v for k, v in store.items() if k != "file_ids"})
+
+    def get_vector_store(self, raw, store_id):
+        with self.state.lock:
+            store = self.state.vector_stores.get(store_id)
+        if store is None:
+            return self._error(404, f"No vector store {store_id}")
+        self._send_json({k: v for k, v in store.items() if k != "file_ids"})
+
+    def delete_vector_store(self, raw, store_id):
+        with self.state.lock:
+            self.state.vector_stores.pop(store_id, None)
+        self._send_json({"id": store_id, "object": "vector_store.deleted", "deleted": True})
+
+    def create_file_batch(self, raw, store_id):
+        body = self._json_body(raw)
+        file_ids = body.get("file_ids") or []
+        with self.state.lock:
+            missing = [file_id for file_id in file_ids if file_id not in self.state.files]
+        if missing:
+            return self._error(404, f"No file found with id '{missing[0]}'")
+        batch = {"id": _new_id("vsfb"), "object": "vector_store.files_batch", "created_at": _now(),
+                 "vector_store_id": store_id, "status": "completed",
+                 "file_counts": {"in_progress": 0, "completed": len(file_ids), "failed": 0,
+                                 "cancelled": 0, "total": len(file_ids)}}
+        with self.state.lock:
+            if store_id in self.state.vector_stores:
+                self.state.vector_stores[store_id]["file_ids"] += file_ids
+            self.state.batches[batch["id"]] = batch
+        self._send_json(batch)
+
+    def get_file_batch(self, raw, store_id, batch_id):
+        with self.state.lock:
+            batch = self.state.batches.get(batch_id)
+        if batch is None:
+            return self._error(404, f"No batch {batch_id}")
+        self._send_json(batch)
+
+    # --- completions & audio ---
+
+    def chat_completion(self, raw, deployment=None):
+        body = self._json_body(raw)
+        time.sleep(self.state.config.reply_tokens / self.state.config.tokens_per_second)
+        self._send_json({"id": _new_id("chatcmpl"), "object": "chat.completion", "created": _now(),
+                         "model": body.get("model", deployment),
+                         "choices": [{"index": 0, "finish_reason": "stop",
+                                      "message": {"role": "assistant", "content": "Resumo simulado."}}],
+                         "usage": {"prompt_tokens": 0, "completion_tokens": 2, "total_tokens": 2}})
+
+    def transcription(self, raw, deployment=None):
+        time.sleep(self.state.config.latency(self.state.config.whisper_ms))
+        self._send_json({"text": f"Transcrição simulada de {len(raw)} bytes."})
+
+
+ROUTES = [
+    (r"/assistants", "POST", MockHandler.create_assistant),
+    (r"/assistants/([^/]+)", "GET", MockHandler.get_assistant),
+    (r"/assistants/([^/]+)", "POST", MockHandler.update_assistant),
+    (r"/threads", "POST", MockHandler.create_thread),
+    (r"/threads/([^/]+)", "POST", MockHandler.update_thread),
+    (r"/threads/([^/]+)", "DELETE", MockHandler.delete_thread),
+    (r"/threads/([^/]+)/messages", "POST", MockHandler.create_message),
+    (r"/threads/([^/]+)/messages", "GET", MockHandler.list_messages),
+    (r"/threads/([^/]+)/runs", "POST", MockHandler.create_run),
+    (r"/threads/([^/]+)/runs/([^/]+)", "GET", MockHandler.get_run),
+    (r"/threads/([^/]+)/runs/([^/]+)/cancel", "POST", MockHandler.cancel_run),
+    (r"/files", "POST", MockHandler.create_file),
+    (r"/files/([^/]+)", "GET", MockHandler.get_file),
+    (r"/vector_stores", "POST", MockHandler.create_vector_store),
+    (r"/vector_stores/([^/]+)", "GET", MockHandler.get_vector_store),
+    (r"/vector_stores/([^/]+)", "DELETE", MockHandler.delete_vector_store),
+    (r"/vector_stores/([^/]+)/file_batches", "POST", MockHandler.create_file_batch),
+    (r"/vector_stores/([^/]+)/file_batches/([^/]+)", "GET", MockHandler.get_file_batch),
+    (r"/chat/completions", "POST", MockHandler.chat_completion),
+    (r"/deployments/([^/]+)/chat/completions", "POST", MockHandler.chat_completion),
+    (r"/audio/transcriptions", "POST", MockHandler.transcription),
+    (r"/deployments/([^/]+)/audio/transcriptions", "POST", MockHandler.transcription),
+]
+
+
+def make_server(config=None, host="127.0.0.1", port=0):
+    """
+    Build a threaded mock server (not yet serving). Port 0 picks a free port.
+    """
+    handler = type("BoundMockHandler", (MockHandler,), {"state": MockState(config or MockConfig())})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_background(config=None, host="127.0.0.1", port=0):
+    """
+    Start a mock server on a daemon thread; returns (server, base_url).
+    """
+    server = make_server(config, host, port)
+    threading.Thread(target=server.serve_forever, name="mock-backend", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Azure OpenAI and Whisper APIs.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--latency-ms", type=float, default=40.0, help="median request latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.4, help="log-normal spread of latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of requests failing with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429")
+    parser.add_argument("--queue-ms", type=float, default=200.0, help="median time a run stays queued")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--whisper-ms", type=float, default=400.0, help="median transcription time")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    config = MockConfig(
+        latency_ms=args.latency_ms, latency_sigma=args.latency_sigma, failure_rate=args.failure_rate,
+        rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after, queue_ms=args.queue_ms,
+        tokens_per_second=args.tokens_per_second, reply_tokens=args.reply_tokens,
+        whisper_ms=args.whisper_ms, seed=args.seed,
+    )
+    server = make_server(config, args.host, args.port)
+    print(f"Mock backend listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
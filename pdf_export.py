@@ -0,0 +1,128 @@
+"""
+Chat PDF export
+---------------
+Incremental exporter for the chat transcript. The cleaned and wrapped lines of
+each message are cached by position and content hash, so an export only lays
+out the turns added since the last one; pagination is then a cheap replay of
+cached lines. The logo is drawn once into a form XObject that every page
+reuses. The finished document is kept as bytes (the caller needs them anyway
+for the download button), so an unchanged transcript reuses the last export
+without holding a temporary file open in the session.
+"""
+
+import re
+import hashlib
+import io
+import threading
+
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+PDF_LINE_HEIGHT = 18
+PDF_PAIR_SPACING = 8  # extra space after each assistant reply
+PDF_LOGO_SIZE = (250, 28)
+
+# Compiled once; applied in order
+MARKDOWN_RULES = [
+    (re.compile(r"```[^\n]*\n?(.*?)```", re.S), r"\1"),  # fenced code
+    (re.compile(r"`([^`\n]*)`"), r"\1"),  # inline code
+    (re.compile(r"\*\*(.+?)\*\*|__(.+?)__", re.S), r"\1\2"),  # bold
+    (re.compile(r"(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?![\w*])|(?<!\w)_(?!\s)(.+?)(?<!\s)_(?!\w)"), r"\1\2"),  # italic
+    (re.compile(r"<u>(.*?)</u>", re.S), r"\1"),  # underline
+    (re.compile(r"^#+\s+", re.M), ""),  # headers
+    (re.compile(r"\[([^\]]+)\]\([^)]+\)"), r"\1"),  # links
+    (re.compile(r" ?\[\d+\]"), ""),  # [n] citations
+]
+
+
+def clean_markdown(text):
+    """
+    Remove or simplify common markdown notations for PDF export.
+    """
+    for pattern, replacement in MARKDOWN_RULES:
+        text = pattern.sub(replacement, text)
+    return text.strip()
+
+
+class ChatPDFExporter:
+    """
+    Per-session PDF exporter of the chat history (ChatMessage records).
+    """
+    def __init__(self, logo_path, font_size=PDF_FONT_SIZE, margin=PDF_MARGIN,
+                 line_height=PDF_LINE_HEIGHT, pair_spacing=PDF_PAIR_SPACING):
+        self.logo_path = logo_path
+        self.font_size = font_size
+        self.margin = margin
+        self.line_height = line_height
+        self.pair_spacing = pair_spacing
+        self._layouts = {}  # (index, digest) -> (font name, wrapped lines)
+        self._logo = None
+        self._pdf_key = None
+        self._pdf_bytes = None
+        self._lock = threading.Lock()
+
+    def _logo_reader(self):
+        if self._logo is None:
+            from reportlab.lib.utils import ImageReader
+            self._logo = ImageReader(self.logo_path)
+        return self._logo
+
+    def _layout(self, index, role, text, width):
+        """
+        Cleaned, wrapped lines of one message; computed once per message.
+        """
+        key = (index, hashlib.blake2b(f"{role}\0{text}".encode(), digest_size=16).digest())
+        layout = self._layouts.get(key)
+        if layout is None:
+            from reportlab.lib.utils import simpleSplit
+            font_name = "Helvetica-Bold" if role == "user" else "Helvetica"
+            layout = (font_name, simpleSplit(clean_markdown(text), font_name, self.font_size, width))
+            self._layouts[key] = layout
+        return key, layout
+
+    def export(self, history):
+        """
+        PDF of the chat history, as bytes.
+        """
+        from reportlab.lib.pagesizes import A4
+        width, height = A4
+        with self._lock:
+            layouts = [
+                self._layout(i, message.role, message.text, width - 2 * self.margin)
+                for i, message in enumerate(history)
+            ]
+            keys = [key for key, _ in layouts]
+            # Drop layouts of messages no longer in the history (e.g. after "New Chat")
+            self._layouts = {key: layout for key, layout in layouts}
+            if keys != self._pdf_key:
+                self._pdf_bytes = self._render(layouts, history, width, height)
+                self._pdf_key = keys
+            return self._pdf_bytes
+
+    def _render(self, layouts, history, width, height):
+        from reportlab.pdfgen import canvas
+        buffer = io.BytesIO()
+        pdf_canvas = canvas.Canvas(buffer, pagesize=(width, height))
+        logo_w, logo_h = PDF_LOGO_SIZE
+        pdf_canvas.beginForm("logo")
+        pdf_canvas.drawImage(
+            self._logo_reader(), self.margin, height - self.margin - logo_h,
+            width=logo_w, height=logo_h, mask="auto",
+        )
+        pdf_canvas.endForm()
+        top = height - self.margin - logo_h - self.line_height
+        pdf_canvas.doForm("logo")
+        y_position = top
+        for (_key, (font_name, lines)), message in zip(layouts, history):
+            pdf_canvas.setFont(font_name, self.font_size)
+            for line in lines:
+                if y_position < self.margin + self.line_height:
+                    pdf_canvas.showPage()
+                    pdf_canvas.setFont(font_name, self.font_size)
+                    pdf_canvas.doForm("logo")
+                    y_position = top
+                pdf_canvas.drawString(self.margin, y_position, line)
+                y_position -= self.line_height
+            if message.role == "assistant":
+                y_position -= self.pair_spacing
+        pdf_canvas.save()
+        return buffer.getvalue()
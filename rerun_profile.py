@@ -0,0 +1,61 @@
+"""
+Rerun cost profiling
+--------------------
+Streamlit re-executes the whole script on every interaction. RerunProfiler
+records how long each phase of one rerun took; RerunStats aggregates those
+timings per process so the slow phases stand out.
+"""
+
+import time
+import threading
+
+
+class RerunProfiler:
+    """
+    Call `mark(phase)` at the end of each phase; the time since the previous mark is charged to it.
+    """
+    def __init__(self):
+        self._start = self._last = time.perf_counter()
+        self.phases = []
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    @property
+    def total(self):
+        return self._last - self._start
+
+
+class RerunStats:
+    """
+    Process-wide count, mean and max duration per phase.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._phases = {}
+        self.reruns = 0
+
+    def record(self, profiler):
+        with self._lock:
+            self.reruns += 1
+            for phase, seconds in profiler.phases + [("total", profiler.total)]:
+                count, total, peak = self._phases.get(phase, (0, 0.0, 0.0))
+                self._phases[phase] = (count + 1, total + seconds, max(peak, seconds))
+
+    def report(self, profiler):
+        """
+        Rows of (phase, this rerun ms, mean ms, max ms) for display.
+        """
+        last = dict(profiler.phases + [("total", profiler.total)])
+        with self._lock:
+            return [
+                {
+                    "phase": phase,
+                    "last_ms": round(last.get(phase, 0.0) * 1000, 1),
+                    "mean_ms": round(total / count * 1000, 1),
+                    "max_ms": round(peak * 1000, 1),
+                }
+                for phase, (count, total, peak) in self._phases.items()
+            ]
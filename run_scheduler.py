@@ -0,0 +1,256 @@
+"""
+Shared run scheduler
+--------------------
+A process-wide asyncio event loop (on a daemon thread) that admits assistant
+runs from every Streamlit session. It caps concurrent runs per model
+deployment, paces run starts with a token bucket that backs off on 429s, and
+rejects new work when the queue is full instead of letting sessions pile up.
+Runs are keyed (by thread): submitting a newer run for the same key, or
+cancelling the key, cancels the superseded run through the API so it stops
+using quota server-side. Background runs (e.g. speculative prefetch) go through
+the same caps and backoff but only start when no agent's run is waiting for a
+slot, and may fill at most half of the queue.
+"""
+
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from openai import RateLimitError
+import metrics
+
+MAX_CONCURRENT_RUNS = 8  # per deployment
+RUNS_PER_SECOND = 2.0
+RUN_BURST = 4
+MAX_QUEUED_RUNS = 64
+RATE_LIMIT_RETRIES = 3
+RATE_LIMIT_BACKOFF = 2.0  # seconds, doubled on each retry unless the API says otherwise
+BACKGROUND_POLL_SECONDS = 0.2  # how often a background run rechecks for a free slot
+
+
+class SchedulerBusy(Exception):
+    """
+    Raised when the run queue is full; the caller should ask the user to retry.
+    """
+
+
+class RunRateLimited(Exception):
+    """
+    Raised by a job whose run failed with a rate-limit error, so the scheduler backs off and retries.
+    """
+    def __init__(self, retry_after=None):
+        super().__init__("run was rate limited")
+        self.retry_after = retry_after
+
+
+class RunHandle:
+    """
+    Shared state between the scheduler and one job. The job reports the run it
+    started and records what it already did, so a retried job does not repeat it.
+    """
+    def __init__(self, key, cancel_run):
+        self.key = key
+        self.thread_id = None
+        self.run_id = None
+        self.message_created = False
+        self.finished = False
+        self._cancel_run = cancel_run
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def run_started(self, thread_id, run_id):
+        with self._lock:
+            self.thread_id, self.run_id = thread_id, run_id
+            cancelled = self.cancelled
+        if cancelled:
+            # Cancelled while the run was being created
+            self._cancel_remote()
+
+    def cancel(self):
+        """
+        Stop the job; if its run already exists, cancel it through the API.
+        """
+        self._cancelled.set()
+        self._cancel_remote()
+
+    def _cancel_remote(self):
+        with self._lock:
+            thread_id, run_id = self.thread_id, self.run_id
+            if run_id is None or self.finished:
+                return
+            self.finished = True
+        try:
+            self._cancel_run(thread_id, run_id)
+        except Exception:
+            pass  # the run already reached a terminal state
+
+
+class TokenBucket:
+    """
+    Asyncio token bucket; `pause` blocks all acquisitions until a deadline (429 backoff).
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class RunScheduler:
+    """
+    Admission control for assistant runs shared by all sessions of the process.
+    `submit` returns a concurrent.futures.Future the UI thread can wait on.
+    """
+    def __init__(self, cancel_run, max_concurrent=MAX_CONCURRENT_RUNS, rate=RUNS_PER_SECOND,
+                 burst=RUN_BURST, max_queued=MAX_QUEUED_RUNS, retries=RATE_LIMIT_RETRIES,
+                 backoff=RATE_LIMIT_BACKOFF):
+        self.cancel_run = cancel_run
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.retries = retries
+        self.backoff = backoff
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="run-scheduler", daemon=True)
+        self._thread.start()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent * 2, thread_name_prefix="run")
+        self._bucket = self._call(lambda: TokenBucket(rate, burst))
+        self._slots = {}  # deployment -> asyncio.Semaphore
+        self._active = {}  # key -> (RunHandle, asyncio.Task)
+        self._pending = 0
+        self._waiting = {}  # deployment -> foreground runs waiting for admission (loop thread only)
+        self._lock = threading.Lock()
+
+    def submit(self, key, job, deployment="default", background=False):
+        """
+        Schedule `job(handle)` to run in a worker thread once admitted.
+        Any earlier run for `key` is cancelled first. Raises SchedulerBusy when the queue is full.
+        A `background` run yields to every waiting foreground run.
+        """
+        limit = self.max_queued // 2 if background else self.max_queued
+        with self._lock:
+            if self._pending >= limit:
+                raise SchedulerBusy()
+            self._pending += 1
+        handle = RunHandle(key, self.cancel_run)
+        return asyncio.run_coroutine_threadsafe(
+            self._schedule(key, handle, job, deployment, background), self._loop
+        )
+
+    def cancel(self, key):
+        """
+        Cancel the queued or running job for `key`, if any (e.g. on "New Chat").
+        """
+        self._loop.call_soon_threadsafe(self._cancel_key, key)
+
+    @property
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+    def _call(self, fn):
+        """
+        Run `fn` on the loop thread (asyncio primitives must be created there).
+        """
+        async def wrapper():
+            return fn()
+        return asyncio.run_coroutine_threadsafe(wrapper(), self._loop).result()
+
+    def _cancel_key(self, key):
+        active = self._active.get(key)
+        if active:
+            handle, task = active
+            self._executor.submit(handle.cancel)
+            task.cancel()
+
+    async def _schedule(self, key, handle, job, deployment, background=False):
+        task = asyncio.current_task()
+        previous = self._active.get(key)
+        self._active[key] = (handle, task)
+        try:
+            if previous:
+                # A newer message supersedes the old run; the thread must be free before we start
+                old_handle, old_task = previous
+                self._executor.submit(old_handle.cancel)
+                old_task.cancel()
+                await asyncio.gather(old_task, return_exceptions=True)
+            return await self._admit_and_run(handle, job, deployment, background)
+        finally:
+            with self._lock:
+                self._pending -= 1
+            if self._active.get(key, (None, None))[1] is task:
+                del self._active[key]
+
+    async def _admit_and_run(self, handle, job, deployment, background=False):
+        slots = self._slots.setdefault(deployment, asyncio.Semaphore(self.max_concurrent))
+        attempt = 0
+        queued_at = time.perf_counter()
+        while True:
+            if background:
+                # Lowest priority: only take a slot no agent's run is waiting for
+                while self._waiting.get(deployment) or slots.locked():
+                    await asyncio.sleep(BACKGROUND_POLL_SECONDS)
+            waiting = not background
+            if waiting:
+                self._waiting[deployment] = self._waiting.get(deployment, 0) + 1
+            try:
+                async with slots:
+                    await self._bucket.acquire()
+                    if waiting:
+                        waiting = False
+                        self._waiting[deployment] -= 1
+                    metrics.observe("stage_duration_seconds", time.perf_counter() - queued_at, stage="run_admission")
+                    worker = self._loop.run_in_executor(self._executor, job, handle)
+                    try:
+                        result = await asyncio.shield(worker)
+                        handle.finished = True
+                        return result
+                    except asyncio.CancelledError:
+                        # Cancel the run through the API and let the worker unwind before freeing the slot
+                        self._executor.submit(handle.cancel)
+                        await asyncio.gather(worker, return_exceptions=True)
+                        raise
+                    except (RateLimitError, RunRateLimited) as exc:
+                        attempt += 1
+                        if attempt > self.retries:
+                            raise
+                        handle.run_id = None  # that run is over; the retry starts a new one
+                        metrics.inc("retries_total", stage="run")
+                        delay = self._retry_after(exc) or self.backoff * 2 ** (attempt - 1)
+                        self._bucket.pause(delay)
+            finally:
+                if waiting:
+                    # Cancelled while still waiting for admission
+                    self._waiting[deployment] -= 1
+
+    @staticmethod
+    def _retry_after(exc):
+        if isinstance(exc, RunRateLimited):
+            return exc.retry_after
+        response = getattr(exc, "response", None)
+        try:
+            return float(response.headers.get("retry-after"))
+        except (AttributeError, TypeError, ValueError):
+            return None
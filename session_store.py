@@ -0,0 +1,251 @@
+"""
+Durable session store
+---------------------
+Keeps each chat session in a local SQLite database, keyed by a session token
+carried in the page URL, so a browser refresh restores the conversation
+(assistant and thread ids, documents, sources, history) without any API call.
+Writes are queued and committed in batches by a background writer thread
+(write-behind), so a chat turn never waits on disk. Reads do not wait for the
+writer either: a session's own writes that are still queued are applied on top
+of what the database holds. Sessions are loaded with only their most recent
+messages; older ones are fetched on demand.
+"""
+
+import json
+import time
+import queue
+import atexit
+import sqlite3
+import threading
+from chat_messages import ChatMessage
+
+SESSION_DB_FILE = "Sessions.db"
+SESSION_FLUSH_INTERVAL = 0.5  # seconds between write-behind batches
+SESSION_MAX_AGE_DAYS = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    token TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    token TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    text TEXT NOT NULL,
+    sources TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    completed_at REAL NOT NULL,
+    PRIMARY KEY (token, seq)
+) WITHOUT ROWID;
+"""
+
+
+class StoredSession:
+    """
+    A restored session: its state dict, the most recent messages, and how many
+    older messages were left in the database.
+    """
+    def __init__(self, state, messages, offset):
+        self.state = state
+        self.messages = messages
+        self.offset = offset
+
+
+class SessionStore:
+    """
+    SQLite-backed store shared by all sessions of the process.
+    Reads go straight to the database; writes are batched by a writer thread.
+    """
+    def __init__(self, path=SESSION_DB_FILE, flush_interval=SESSION_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._queue = queue.Queue()
+        self._flushed = threading.Condition()
+        self._submitted = 0
+        self._written = 0
+        self._queued = {}  # token -> its ops not yet committed, oldest first
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+        threading.Thread(target=self._writer_loop, name="session-store", daemon=True).start()
+        atexit.register(self.flush)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self):
+        # One connection per reading thread; sqlite3 connections are not shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # --- reads ---
+
+    def load(self, token, limit):
+        """
+        The session for `token` with its last `limit` messages, or None if unknown.
+        Writes of this session still queued are included; other sessions' are not waited for.
+        """
+        conn = self._reader()
+        # Holding the lock keeps the writer from retiring a batch meanwhile, so every
+        # op is either in the database or in `ops` (or both: replaying it is harmless)
+        with self._flushed:
+            ops = list(self._queued.get(token, ()))
+            row = conn.execute("SELECT state, message_count FROM sessions WHERE token = ?", (token,)).fetchone()
+            state, count = (json.loads(row[0]), row[1]) if row else (None, 0)
+            for kind, _token, payload in ops:
+                if kind == "state":
+                    state = json.loads(payload)
+                elif kind == "messages" and payload:
+                    count = max(count, payload[-1][1] + 1)
+                elif kind == "reset":
+                    count = 0
+            if state is None:
+                return None
+            offset = max(count - limit, 0)
+            messages = self._read_messages(conn, token, offset, count, ops)
+        return StoredSession(state, messages, offset)
+
+    def load_messages(self, token, start, end):
+        """
+        Messages with sequence numbers in [start, end), oldest first.
+        """
+        conn = self._reader()
+        with self._flushed:
+            return self._read_messages(conn, token, start, end, list(self._queued.get(token, ())))
+
+    @staticmethod
+    def _read_messages(conn, token, start, end, ops):
+        rows = {
+            seq: row for seq, *row in conn.execute(
+                "SELECT seq, role, text, sources, created_at, completed_at FROM messages "
+                "WHERE token = ? AND seq >= ? AND seq < ?",
+                (token, start, end),
+            )
+        }
+        for kind, _token, payload in ops:
+            if kind == "reset":
+                rows.clear()
+            elif kind == "messages":
+                rows.update((seq, row) for _token, seq, *row in payload if start <= seq < end)
+        return [ChatMessage(role, text, json.loads(sources), created_at, completed_at)
+                for role, text, sources, created_at, completed_at in (rows[seq] for seq in sorted(rows))]
+
+    # --- write-behind ---
+
+    def save_state(self, token, state):
+        """
+        Queue the session's state dict (latest write wins within a batch).
+        """
+        self._submit(("state", token, json.dumps(state)))
+
+    def append_messages(self, token, start_seq, messages):
+        """
+        Queue new messages, numbered from `start_seq`.
+        """
+        rows = [
+            (token, start_seq + i, m.role, m.text, json.dumps(list(m.sources)), m.created_at, m.completed_at)
+            for i, m in enumerate(messages)
+        ]
+        self._submit(("messages", token, rows))
+
+    def reset(self, token):
+        """
+        Queue removal of the session's messages (e.g. on "New Chat").
+        """
+        self._submit(("reset", token, None))
+
+    def cleanup(self, max_age_days=SESSION_MAX_AGE_DAYS):
+        """
+        Queue removal of sessions untouched for `max_age_days`.
+        """
+        self._submit(("cleanup", None, time.time() - max_age_days * 86400))
+
+    def flush(self, timeout=5):
+        """
+        Wait until everything queued so far is committed.
+        """
+        with self._flushed:
+            target = self._submitted
+            self._flushed.wait_for(lambda: self._written >= target, timeout)
+
+    def _submit(self, op):
+        with self._flushed:
+            self._submitted += 1
+            if op[1] is not None:
+                self._queued.setdefault(op[1], []).append(op)
+        self._queue.put(op)
+
+    def _writer_loop(self):
+        conn = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(conn, batch)
+            except sqlite3.Error:
+                pass  # a lost batch only costs restore fidelity; the live session is unaffected
+            with self._flushed:
+                self._written += len(batch)
+                for op in batch:
+                    self._retire(op)
+                self._flushed.notify_all()
+
+    def _retire(self, op):
+        token = op[1]
+        if token is None:
+            return
+        ops = self._queued[token]
+        ops.pop(0)  # ops of a token are written in the order they were queued
+        if not ops:
+            del self._queued[token]
+
+    def _write_batch(self, conn, batch):
+        states = {}
+        with conn:
+            for kind, token, payload in batch:
+                if kind == "state":
+                    states[token] = payload
+                    continue
+                # Order matters for these, so pending state writes go first
+                self._write_states(conn, states)
+                states = {}
+                if kind == "messages":
+                    conn.executemany("INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?)", payload)
+                    conn.execute(
+                        "UPDATE sessions SET message_count = MAX(message_count, ?) WHERE token = ?",
+                        (payload[-1][1] + 1 if payload else 0, token),
+                    )
+                elif kind == "reset":
+                    conn.execute("DELETE FROM messages WHERE token = ?", (token,))
+                    conn.execute("UPDATE sessions SET message_count = 0 WHERE token = ?", (token,))
+                elif kind == "cleanup":
+                    stale = "SELECT token FROM sessions WHERE updated_at < ?"
+                    conn.execute(f"DELETE FROM messages WHERE token IN ({stale})", (payload,))
+                    conn.execute("DELETE FROM sessions WHERE updated_at < ?", (payload,))
+            self._write_states(conn, states)
+
+    @staticmethod
+    def _write_states(conn, states):
+        now = time.time()
+        for token, state in states.items():
+            conn.execute(
+                "INSERT INTO sessions (token, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(token) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                (token, state, now),
+            )
@@ -0,0 +1,148 @@
+"""
+Incremental, VAD-segmented transcription
+----------------------------------------
+Cuts the audio captured in an AudioBuffer into utterances at pauses, using a
+simple energy-based voice activity detector, and transcribes each utterance in
+a background worker while recording continues. When the agent stops talking
+only the last utterance is still pending, so the question is ready almost
+immediately. If no utterance was found (or none could be transcribed), the
+whole recording is transcribed when recording stops.
+"""
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+VAD_WINDOW_SECONDS = 0.03
+VAD_THRESHOLD_DBFS = -45.0  # never treat quieter audio as speech
+VAD_NOISE_MARGIN_DB = 10.0  # speech must be this much louder than the noise floor
+VAD_NOISE_HISTORY_SECONDS = 10.0  # recent audio the noise floor is estimated from
+VAD_NOISE_PERCENTILE = 5  # the quietest recent windows are taken as background noise
+VAD_NOISE_SEED_SECONDS = 0.3  # audio needed before the first noise floor estimate
+MIN_SILENCE_SECONDS = 0.6  # pause length that ends an utterance
+MIN_SPEECH_SECONDS = 0.25  # shorter bursts are treated as noise
+MAX_SEGMENT_SECONDS = 20.0  # force a cut in very long utterances
+SEGMENT_PADDING_SECONDS = 0.2
+TRANSCRIBE_WORKERS = 2
+
+
+class EnergyVAD:
+    """
+    Classifies fixed-size windows of int16 audio as speech or silence by RMS energy,
+    against an adaptive noise floor.
+    """
+    def __init__(self, threshold_dbfs=VAD_THRESHOLD_DBFS, noise_margin_db=VAD_NOISE_MARGIN_DB,
+                 window_seconds=VAD_WINDOW_SECONDS):
+        self.threshold_dbfs = threshold_dbfs
+        self.noise_margin_db = noise_margin_db
+        self.noise_floor = -60.0
+        self._levels = deque(maxlen=int(VAD_NOISE_HISTORY_SECONDS / window_seconds))
+        self._seed_windows = max(1, int(VAD_NOISE_SEED_SECONDS / window_seconds))
+
+    def is_speech(self, window):
+        rms = np.sqrt(np.mean(np.square(window.astype(np.float32)))) / 32768.0
+        level = 20.0 * np.log10(max(rms, 1e-9))
+        self._levels.append(level)
+        # Steady noise above the threshold never counts as silence, so the floor must
+        # also rise to the quietest recent windows, or utterances are never cut
+        floor = max(self.noise_floor, float(np.percentile(self._levels, VAD_NOISE_PERCENTILE)))
+        if len(self._levels) >= self._seed_windows:
+            self.noise_floor = floor
+        # Until then the estimate is only provisional, so a noisy room is not speech from the start
+        speech = level > max(self.threshold_dbfs, floor + self.noise_margin_db)
+        if not speech:
+            # Slowly follow the background level so a noisy room does not count as speech
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * level
+        return speech
+
+
+class SegmentingTranscriber:
+    """
+    Watches an AudioBuffer and transcribes each detected utterance in the background.
+    `transcribe(pcm, sample_rate, language)` must return the text for one int16 segment.
+    """
+    def __init__(self, buffer, transcribe, language="pt", vad=None, max_workers=TRANSCRIBE_WORKERS):
+        self.buffer = buffer
+        self.transcribe = transcribe
+        self.language = language
+        self.vad = vad or EnergyVAD()
+        rate = buffer.sample_rate
+        self.window = int(VAD_WINDOW_SECONDS * rate)
+        self.min_silence = int(MIN_SILENCE_SECONDS * rate)
+        self.min_speech = int(MIN_SPEECH_SECONDS * rate)
+        self.max_segment = int(MAX_SEGMENT_SECONDS * rate)
+        self.padding = int(SEGMENT_PADDING_SECONDS * rate)
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="transcribe")
+        self._futures = []
+        self._scanned = 0  # absolute sample index up to which the VAD has run
+        self._speech_start = None
+        self._speech_samples = 0
+        self._last_speech_end = None
+
+    def update(self):
+        """
+        Run the VAD over newly buffered audio and submit every finished utterance.
+        Called from the audio thread after each appended frame.
+        """
+        with self._lock:
+            total = self.buffer.total_samples
+            if total - self._scanned < self.window:
+                return
+            new = self.buffer.to_array(start=self._scanned)
+            # Audio older than the ring buffer is gone; resync to what is still held
+            self._scanned = total - new.size
+            usable = new.size - new.size % self.window
+            for offset in range(0, usable, self.window):
+                start = self._scanned + offset
+                end = start + self.window
+                if self.vad.is_speech(new[offset:offset + self.window]):
+                    if self._speech_start is None:
+                        self._speech_start = start
+                        self._speech_samples = 0
+                    self._speech_samples += self.window
+                    self._last_speech_end = end
+                elif self._speech_start is not None and end - self._last_speech_end >= self.min_silence:
+                    self._cut(self._last_speech_end)
+                if self._speech_start is not None and end - self._speech_start >= self.max_segment:
+                    self._cut(end)
+            self._scanned += usable
+
+    def _cut(self, end):
+        if self._speech_samples >= self.min_speech:
+            start = max(0, self._speech_start - self.padding)
+            end = min(self.buffer.total_samples, end + self.padding)
+            pcm = self.buffer.to_array(start=start, end=end)
+            self._futures.append(
+                self._pool.submit(self.transcribe, pcm, self.buffer.sample_rate, self.language)
+            )
+        self._speech_start = None
+        self._speech_samples = 0
+        self._last_speech_end = None
+
+    def finish(self, timeout=None):
+        """
+        Flush the trailing utterance, wait for all segments and return the stitched transcript.
+        Falls back to transcribing the whole buffer when that yields no text.
+        """
+        self.update()
+        with self._lock:
+            if self._speech_start is not None:
+                self._cut(self._last_speech_end)
+            futures = list(self._futures)
+        texts = [self._result(future, timeout) for future in futures]
+        transcript = " ".join(t for t in texts if t)
+        if not transcript and len(self.buffer):
+            # The VAD found no utterance (e.g. a noisy room or a very short answer)
+            future = self._pool.submit(self.transcribe, self.buffer.to_array(), self.buffer.sample_rate, self.language)
+            transcript = self._result(future, timeout)
+        self._pool.shutdown(wait=False)
+        return transcript
+
+    @staticmethod
+    def _result(future, timeout=None):
+        try:
+            return (future.result(timeout) or "").strip()
+        except Exception:
+            return ""
@@ -0,0 +1,106 @@
+"""
+Whisper transcription client
+----------------------------
+One shared HTTP session per process (connection pooling and keep-alive), with
+connect/read timeouts and exponential backoff retries on connection errors,
+429 and 5xx responses. Audio is encoded in memory to FLAC or Ogg/Opus before
+upload; no temporary files are written. The base URL is configurable so a
+local stand-in server can be used.
+"""
+
+import io
+import requests
+import soundfile as sf
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import metrics
+
+WHISPER_BASE_URL = "https://api.openai.com/v1"
+WHISPER_MODEL = "whisper-1"
+WHISPER_CONNECT_TIMEOUT = 5  # seconds
+WHISPER_READ_TIMEOUT = 60  # seconds
+WHISPER_RETRIES = 3
+WHISPER_BACKOFF = 0.5  # seconds, doubled on each retry
+WHISPER_POOL_SIZE = 16
+
+# format name -> (libsndfile format, subtype, file name, mime type)
+AUDIO_FORMATS = {
+    "flac": ("FLAC", "PCM_16", "audio.flac", "audio/flac"),
+    "opus": ("OGG", "OPUS", "audio.ogg", "audio/ogg"),
+    "wav": ("WAV", "PCM_16", "audio.wav", "audio/wav"),
+}
+
+
+def encode_audio(pcm, sample_rate, audio_format="flac"):
+    """
+    Encode int16 mono samples in memory. Returns (file name, bytes, mime type).
+    Falls back to WAV when the installed libsndfile lacks the requested codec.
+    """
+    fmt, subtype, file_name, mime = AUDIO_FORMATS[audio_format]
+    if subtype not in sf.available_subtypes(fmt):
+        fmt, subtype, file_name, mime = AUDIO_FORMATS["wav"]
+    buffer = io.BytesIO()
+    sf.write(buffer, pcm, sample_rate, format=fmt, subtype=subtype)
+    return file_name, buffer.getvalue(), mime
+
+
+class WhisperClient:
+    """
+    Thread-safe Whisper API client sharing one pooled, retrying session.
+    """
+    def __init__(self, api_key, base_url=WHISPER_BASE_URL, model=WHISPER_MODEL,
+                 audio_format="flac", connect_timeout=WHISPER_CONNECT_TIMEOUT,
+                 read_timeout=WHISPER_READ_TIMEOUT, retries=WHISPER_RETRIES,
+                 backoff=WHISPER_BACKOFF, pool_size=WHISPER_POOL_SIZE):
+        self.url = f"{base_url.rstrip('/')}/audio/transcriptions"
+        self.model = model
+        self.audio_format = audio_format
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"POST"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {api_key}"
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def transcribe_pcm(self, pcm, sample_rate, language="pt"):
+        """
+        Transcribe int16 mono samples, compressed in memory before upload.
+        """
+        return self.transcribe_file(*encode_audio(pcm, sample_rate, self.audio_format), language=language)
+
+    def transcribe_file(self, file_name, data, mime, language="pt"):
+        """
+        Transcribe an already encoded audio file (bytes or binary file-like object).
+        Returns the recognized text, or "" when the request fails.
+        """
+        try:
+            with metrics.span("whisper"):
+                response = self.session.post(
+                    self.url,
+                    files={"file": (file_name, data, mime)},
+                    data={"model": self.model, "language": language},
+                    timeout=self.timeout,
+                )
+        except requests.Timeout:
+            metrics.inc("timeouts_total", stage="whisper")
+            return ""
+        except requests.RequestException:
+            return ""
+        retries = getattr(response.raw, "retries", None)
+        if retries is not None and retries.history:
+            metrics.inc("retries_total", len(retries.history), stage="whisper")
+        if not response.ok:
+            return ""
+        try:
+            payload = response.json()
+        except ValueError:
+            return ""
+        return payload.get("text", "")
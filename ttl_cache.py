@@ -0,0 +1,62 @@
+"""
+Thread-safe LRU cache with per-entry time-to-live
+-------------------------------------------------
+Small building block for the process-wide caches shared by Streamlit sessions.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Keeps at most `maxsize` entries, evicting the least recently used one first.
+    Entries older than `ttl` seconds are treated as missing.
+    """
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            stored_at, value = item
+            if time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+        return default if item is _MISSING else item[1]
+
+    def items(self):
+        """
+        Snapshot of the live (key, value) pairs, most recently used last.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [(k, v) for k, (t, v) in self._data.items() if now - t <= self.ttl]
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,206 @@
+"""
+Vector store manager
+--------------------
+Builds one vector store per distinct set of documents, keyed by the content
+hashes of its files, and reuses it for every thread that works with that set.
+Stores are ingested in one file batch, indexed once, and expire server-side
+after a period of inactivity; unused local entries are cleaned up as well.
+A batch that fails because some of its files were deleted server-side raises
+StaleFilesError naming them, so the caller can forget and re-upload them.
+The registry file is shared by all app processes: every change is applied to
+a fresh read of it under a file lock.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from openai import NotFoundError
+from assistant_registry import file_lock
+import metrics
+
+VECTOR_STORE_EXPIRY_DAYS = 7
+VECTOR_STORE_MAX_IDLE = VECTOR_STORE_EXPIRY_DAYS * 24 * 3600  # seconds
+
+
+def document_set_key(digests):
+    """
+    Stable key for a set of documents, independent of upload order and duplicates.
+    """
+    return hashlib.sha256("\n".join(sorted(set(digests))).encode()).hexdigest()
+
+
+class StaleFilesError(Exception):
+    """
+    Raised when files of a document set no longer exist server-side.
+    """
+    def __init__(self, file_ids):
+        super().__init__(f"files no longer exist: {', '.join(file_ids)}")
+        self.file_ids = file_ids
+
+
+class VectorStoreManager:
+    """
+    Persistent document-set key -> vector store id registry.
+    Stores are validated against the API once per process, not once per turn.
+    """
+    def __init__(self, client, path, expiry_days=VECTOR_STORE_EXPIRY_DAYS):
+        self.client = client
+        self.path = path
+        self.expiry_days = expiry_days
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._validated = set()
+        self._entries = self._read() or {}
+
+    def get_or_create(self, pairs):
+        """
+        Return the vector store id for the (digest, file_id) `pairs`,
+        creating and indexing the store on first use.
+        """
+        key = document_set_key([digest for digest, _ in pairs])
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # One builder per document set; other sessions wait for it instead of duplicating it
+        with key_lock:
+            store_id = self._lookup(key)
+            if store_id is None:
+                store_id = self._create(key, sorted({file_id for _, file_id in pairs}))
+            self._touch(key)
+        return store_id
+
+    def bind_to_thread(self, thread_id, store_id):
+        """
+        Attach the store to a thread via tool resources, so messages need no attachments.
+        """
+        with metrics.span("thread_bind"):
+            self.client.beta.threads.update(
+                thread_id,
+                tool_resources={"file_search": {"vector_store_ids": [store_id]}},
+            )
+
+    def cleanup(self, max_idle=VECTOR_STORE_MAX_IDLE):
+        """
+        Delete stores that have not been used locally for `max_idle` seconds.
+        """
+        now = time.time()
+        with self._lock:
+            stale = {k: e for k, e in self._entries.items() if now - e["last_used"] > max_idle}
+        for key, entry in stale.items():
+            try:
+                self.client.vector_stores.delete(entry["id"])
+            except NotFoundError:
+                pass  # already expired server-side
+            with self._lock:
+                self._validated.discard(key)
+        if stale:
+            def drop(entries):
+                for key, entry in stale.items():
+                    # Another process may have rebuilt the store meanwhile
+                    if entries.get(key, {}).get("id") == entry["id"]:
+                        del entries[key]
+            self._update(drop)
+        return len(stale)
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            validated = key in self._validated
+        if entry is None:
+            # Another process may have built it since this one last read the file
+            entry = (self._read() or {}).get(key)
+        if entry is None or validated:
+            return entry and entry["id"]
+        try:
+            with metrics.span("vector_store_retrieve"):
+                store = self.client.vector_stores.retrieve(entry["id"])
+            alive = store.status != "expired"
+        except NotFoundError:
+            alive = False
+        if not alive:
+            def drop(entries):
+                if entries.get(key, {}).get("id") == entry["id"]:
+                    del entries[key]
+            self._update(drop)
+            return None
+        with self._lock:
+            self._entries.setdefault(key, entry)
+            self._validated.add(key)
+        return entry["id"]
+
+    def _create(self, key, file_ids):
+        with metrics.span("vector_store_create"):
+            store = self.client.vector_stores.create(
+                name=f"docs-{key[:12]}",
+                expires_after={"anchor": "last_active_at", "days": self.expiry_days},
+            )
+        error = None
+        try:
+            with metrics.span("vector_store_index"):
+                batch = self.client.vector_stores.file_batches.create_and_poll(store.id, file_ids=file_ids)
+            failed = batch.status != "completed" or batch.file_counts.failed
+        except NotFoundError as exc:
+            error, failed = exc, True
+        if failed:
+            missing = [file_id for file_id in file_ids if not self._file_exists(file_id)]
+            if missing:
+                try:
+                    self.client.vector_stores.delete(store.id)
+                except NotFoundError:
+                    pass
+                raise StaleFilesError(missing)
+            if error is not None:
+                raise error
+
+        def add(entries):
+            entries[key] = {"id": store.id, "file_ids": file_ids, "last_used": time.time()}
+        self._update(add)
+        with self._lock:
+            self._validated.add(key)
+        return store.id
+
+    def _file_exists(self, file_id):
+        try:
+            self.client.files.retrieve(file_id)
+            return True
+        except NotFoundError:
+            return False
+
+    def _touch(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+        # Streamlit calls this on every rerun; only hit the disk once a minute
+        if entry is None or now - entry["last_used"] <= 60:
+            return
+
+        def touch(entries):
+            if key in entries:
+                entries[key]["last_used"] = max(entries[key]["last_used"], now)
+        self._update(touch)
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _update(self, change):
+        """
+        Apply `change` to the entries on disk (other processes may have changed them),
+        save them and adopt them as this process's view.
+        """
+        with self._lock, file_lock(f"{self.path}.lock"):
+            entries = self._read()
+            if entries is None:
+                entries = dict(self._entries)
+            change(entries)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+            self._entries = entries